@@ -8,10 +8,83 @@ load_dotenv()
 BACKEND_DIR = pathlib.Path(__file__).parent.parent.parent.absolute()
 USERS_FILE = BACKEND_DIR / "users.json"
 
+# User storage: "sqlite", or "json" (users.json, rewritten on every signup; shared by the
+# worker processes of one host through a file lock)
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "sqlite").lower()
+# On first start the SQLite store imports any users found in USERS_FILE
+USERS_DB_PATH = pathlib.Path(os.getenv("USERS_DB_PATH", str(BACKEND_DIR / "users.db")))
+USERS_DB_POOL_SIZE = int(os.getenv("USERS_DB_POOL_SIZE", "4"))
+
+# LLM backend: "openai" talks to the OpenAI API (or OPENAI_BASE_URL), "stub" answers in-process
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
 # Check for API key
-if not os.getenv("OPENAI_API_KEY"):
+if LLM_BACKEND == "openai" and not OPENAI_API_KEY:
     raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your .env file")
 
+# Connection pool shared by all requests to the LLM backend
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Seconds the startup warm-up waits for the first connection to the LLM API
+LLM_WARMUP_TIMEOUT = float(os.getenv("LLM_WARMUP_TIMEOUT", "10"))
+
+# Model call deadlines: per attempt (for streams, until the first and between chunks)
+# and for all attempts of one call together
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "45"))
+LLM_TOTAL_TIMEOUT_SECONDS = float(os.getenv("LLM_TOTAL_TIMEOUT_SECONDS", "90"))
+# Retries of timeouts, connection errors, 429 and 5xx, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# Hedging: a second identical request is sent when the first has not answered after
+# the LLM_HEDGE_QUANTILE of recent call latencies (at least LLM_HEDGE_MIN_DELAY seconds)
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2"))
+# Circuit breaker: opens for LLM_BREAKER_OPEN_SECONDS when at least LLM_BREAKER_FAILURE_RATE
+# of the last LLM_BREAKER_WINDOW calls failed or took over LLM_BREAKER_SLOW_CALL_SECONDS
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "30"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+# Model served while the circuit is open; empty fails fast with 503 instead
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+
+# Simulated response latency for the stub backend
+LLM_STUB_LATENCY_MS = int(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+
+# Structured output: "json_schema" binds replies to the analysis schema, "json_object"
+# only forces valid JSON (for compatible servers without schema support), "off" neither
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "json_schema").lower()
+# Completion token budget of one analysis; a typical answer needs 250-400 tokens
+ANALYSIS_MAX_TOKENS = int(os.getenv("ANALYSIS_MAX_TOKENS", "800"))
+
+# Local image-quality gate run before the model call: "reject" refuses unusable
+# images with 422, "warn" only attaches warnings, "off" skips the checks
+QUALITY_GATE_MODE = os.getenv("QUALITY_GATE_MODE", "reject").lower()
+# Shorter image side in pixels
+QUALITY_MIN_RESOLUTION = int(os.getenv("QUALITY_MIN_RESOLUTION", "224"))
+# Variance of the Laplacian on a 512 px grayscale copy; lower means blurrier
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "40"))
+# Mean grayscale brightness bounds (0-255)
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "35"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "230"))
+# Below this fraction of skin-coloured pixels a warning is attached
+QUALITY_MIN_SKIN_FRACTION = float(os.getenv("QUALITY_MIN_SKIN_FRACTION", "0.05"))
+
+# Analysis result cache, keyed by the normalized image and patient information
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+# Directory for the persistent tier; leave empty to keep the cache in memory only
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "")
+ANALYSIS_CACHE_DISK_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_ENTRIES", "10000"))
+
 # Security configurations
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -20,6 +93,108 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Refresh tokens let clients get new access tokens from /token/refresh without a password check
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+REFRESH_TOKEN_DB_PATH = os.getenv("REFRESH_TOKEN_DB_PATH", str(BACKEND_DIR / "refresh_tokens.db"))
+
+# Verified-token cache used by get_current_user; entries also expire after
+# TOKEN_CACHE_MAX_AGE_SECONDS so user changes made by other workers are seen
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_CACHE_MAX_AGE_SECONDS = int(os.getenv("TOKEN_CACHE_MAX_AGE_SECONDS", "300"))
+
+# Password hashing: bcrypt cost factor; hashes with another cost are upgraded at next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads for bcrypt hashing/verification, kept off the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Analysis concurrency
+# Maximum number of analyses in flight per worker; extra requests wait for a slot
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "32"))
+# Batch analysis: images accepted per request and analyzed concurrently per batch
+ANALYSIS_BATCH_MAX_IMAGES = int(os.getenv("ANALYSIS_BATCH_MAX_IMAGES", "10"))
+ANALYSIS_BATCH_CONCURRENCY = int(os.getenv("ANALYSIS_BATCH_CONCURRENCY", "4"))
+# Threads used for CPU-bound image decoding/encoding off the event loop
+IMAGE_WORKER_THREADS = int(os.getenv("IMAGE_WORKER_THREADS", "4"))
+
+# Outbound image encoding: long edge cap in pixels and JPEG quality (1-95)
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Upload limits: bytes accepted per uploaded image (larger uploads get 413 while
+# still streaming in) and decoded pixels per image (decompression-bomb guard)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+
+# Follow-up chat: sessions hold the analysis result and recent turns in worker memory,
+# evicting the least recently used beyond CHAT_SESSION_MAX and idle ones after the TTL
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+CHAT_SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", "3600"))
+# Token budgets of a chat turn: recent turns resent verbatim, the summary of older
+# turns, and the reply
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "1500"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "500"))
+CHAT_MESSAGE_MAX_CHARS = int(os.getenv("CHAT_MESSAGE_MAX_CHARS", "4000"))
+# Client-sent turns accepted when a session has to be rebuilt; older ones are the client's to drop
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", "20"))
+
+# Analysis history: finished analyses of signed-in users, saved with a thumbnail
+# (long edge in pixels) instead of the uploaded image
+ANALYSIS_HISTORY_ENABLED = os.getenv("ANALYSIS_HISTORY_ENABLED", "true").lower() == "true"
+ANALYSIS_HISTORY_DB_PATH = os.getenv("ANALYSIS_HISTORY_DB_PATH", str(BACKEND_DIR / "analyses.db"))
+ANALYSIS_HISTORY_THUMBNAIL_EDGE = int(os.getenv("ANALYSIS_HISTORY_THUMBNAIL_EDGE", "256"))
+# Page size of GET /api/analyses when none is given, and the largest allowed
+ANALYSIS_HISTORY_PAGE_SIZE = int(os.getenv("ANALYSIS_HISTORY_PAGE_SIZE", "20"))
+ANALYSIS_HISTORY_MAX_PAGE_SIZE = int(os.getenv("ANALYSIS_HISTORY_MAX_PAGE_SIZE", "100"))
+
+# Asynchronous analysis jobs
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", str(BACKEND_DIR / "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Queued jobs above this depth are rejected with 503 and Retry-After
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))
+# Worker processes lease the jobs they hold and renew the lease every third of this;
+# jobs of a process that stopped renewing are picked up by another one after it expires
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Finished jobs older than this are deleted at startup
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+# Comma-separated hosts allowed as callback_url targets (internal ones included); empty
+# allows any host that resolves to public addresses only
+JOB_CALLBACK_ALLOWED_HOSTS = [host.strip() for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()]
+
+# Rate limiting: token buckets keyed by user, or by client IP for anonymous requests
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# "memory" keeps buckets per worker process; "sqlite" shares them between workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", str(BACKEND_DIR / "rate_limits.db"))
+# Burst size and sustained rate per minute of each bucket
+RATE_LIMIT_ANALYSIS_BURST = int(os.getenv("RATE_LIMIT_ANALYSIS_BURST", "10"))
+RATE_LIMIT_ANALYSIS_PER_MINUTE = float(os.getenv("RATE_LIMIT_ANALYSIS_PER_MINUTE", "6"))
+RATE_LIMIT_LOGIN_BURST = int(os.getenv("RATE_LIMIT_LOGIN_BURST", "5"))
+RATE_LIMIT_LOGIN_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOGIN_PER_MINUTE", "10"))
+RATE_LIMIT_SIGNUP_BURST = int(os.getenv("RATE_LIMIT_SIGNUP_BURST", "3"))
+RATE_LIMIT_SIGNUP_PER_MINUTE = float(os.getenv("RATE_LIMIT_SIGNUP_PER_MINUTE", "1"))
+RATE_LIMIT_CHAT_BURST = int(os.getenv("RATE_LIMIT_CHAT_BURST", "10"))
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20"))
+# Images analyzed per user (or IP) per UTC day; 0 disables the quota
+ANALYSIS_DAILY_QUOTA = int(os.getenv("ANALYSIS_DAILY_QUOTA", "100"))
+# Apply the daily quota to anonymous clients by IP. Set to false when the app only sees a
+# proxy's address (see FORWARDED_ALLOW_IPS), or all anonymous clients share one quota
+ANALYSIS_DAILY_QUOTA_PER_IP = os.getenv("ANALYSIS_DAILY_QUOTA_PER_IP", "true").lower() == "true"
+# Buckets kept per worker by the memory backend; least recently used keys are dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# On-demand request profiling: a request sent with "X-Profile: <PROFILE_TOKEN>" is
+# profiled (empty token disables this), as is a random PROFILE_SAMPLE_RATE fraction
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = pathlib.Path(os.getenv("PROFILE_DIR", str(BACKEND_DIR / "profiles")))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Only one request is profiled at a time, and at most once per this many seconds
+PROFILE_MIN_INTERVAL_SECONDS = float(os.getenv("PROFILE_MIN_INTERVAL_SECONDS", "30"))
+# Oldest profiles are deleted beyond this count
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+
 # CORS origins
 CORS_ORIGINS = [
     "http://localhost:5173",
@@ -35,3 +210,19 @@ CORS_ORIGINS = [
     "https://precision-skin-insights-api.onrender.com/api/analyze",
     "https://precision-skin-insights-api.onrender.com/api/analyze/"
 ]
+
+# Production server (gunicorn.conf.py): worker processes, 0 for one per available CPU core
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+PORT = int(os.getenv("PORT", "8001"))
+# Workers are replaced after this many requests, plus a random jitter so they do not all
+# restart at once, to bound memory growth
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "2000"))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "200"))
+# Seconds a stopping worker gets to finish in-flight requests, longer than a model call may take
+WORKER_GRACEFUL_TIMEOUT = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", str(int(LLM_TOTAL_TIMEOUT_SECONDS) + 30)))
+# A worker whose event loop has been blocked this long is killed and replaced
+WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", "60"))
+# Proxies trusted to set X-Forwarded-For/-Proto, so rate limits see the real client address.
+# "*" fits a platform proxy (Render) that is the only way to reach the app; list the proxy
+# addresses instead when clients can connect directly
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "*")
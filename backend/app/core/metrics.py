@@ -0,0 +1,36 @@
+from ..utils.metrics import metrics, BYTE_BUCKETS
+
+# Image analysis pipeline
+analysis_stage_seconds = metrics.histogram(
+    "analysis_stage_seconds",
+    "Time spent in each stage of an image analysis",
+    ["stage"],
+)
+analyses_in_flight = metrics.gauge("analyses_in_flight", "Analyses holding a concurrency slot")
+analyses_waiting = metrics.gauge("analyses_waiting", "Analyses waiting for a concurrency slot")
+analysis_errors_total = metrics.counter("analysis_errors_total", "Failed analyses by cause", ["cause"])
+upload_bytes = metrics.histogram("upload_bytes", "Size of uploaded images in bytes", buckets=BYTE_BUCKETS)
+request_body_rejected_total = metrics.counter(
+    "request_body_rejected_total", "Requests refused with 413 because the body was over the limit"
+)
+
+# Authentication
+password_hash_seconds = metrics.histogram(
+    "password_hash_seconds",
+    "Time to hash or verify a password with bcrypt, including the wait for a pool thread",
+    ["operation"],
+)
+password_hash_in_flight = metrics.gauge("password_hash_in_flight", "bcrypt calls queued or running")
+current_user_seconds = metrics.histogram(
+    "current_user_seconds",
+    "Time to resolve the user of a bearer token",
+    ["cache"],
+)
+auth_failures_total = metrics.counter("auth_failures_total", "Rejected logins and bearer tokens by cause", ["cause"])
+
+# Rate limiting
+rate_limited_total = metrics.counter("rate_limited_total", "Requests refused with 429 by bucket", ["bucket"])
+
+# Follow-up chat
+chat_reply_seconds = metrics.histogram("chat_reply_seconds", "Time to answer a follow-up chat message")
+chat_errors_total = metrics.counter("chat_errors_total", "Failed chat replies by cause", ["cause"])
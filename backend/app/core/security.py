@@ -1,17 +1,27 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
-from .config import SECRET_KEY, ALGORITHM
+from .config import SECRET_KEY, ALGORITHM, BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
+from .metrics import password_hash_seconds, password_hash_in_flight, current_user_seconds, auth_failures_total
+from .token_cache import token_cache
 from ..models.user import TokenData
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# Bounded pool for bcrypt work (~250 ms of CPU per call at cost 12)
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Same scheme for endpoints that also serve anonymous clients
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -21,6 +31,16 @@ def get_password_hash(password: str) -> str:
     """Generate password hash."""
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash if the stored one uses outdated settings."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def run_in_password_pool(func, *args):
+    """Run a bcrypt function in the password thread pool."""
+    loop = asyncio.get_running_loop()
+    with password_hash_in_flight.track_inprogress(), password_hash_seconds.time(operation=func.__name__):
+        return await loop.run_in_executor(_password_executor, func, *args)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -37,6 +57,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     # Import here to avoid circular import
     from ..services.user_service import get_user
     
+    # Repeat requests with the same token skip JWT verification and the user lookup
+    started = time.perf_counter()
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        current_user_seconds.observe(time.perf_counter() - started, cache="hit")
+        return cached_user
+    
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -46,11 +73,34 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
+            auth_failures_total.inc(cause="invalid_token")
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
+        auth_failures_total.inc(cause="invalid_token")
         raise credentials_exception
-    user = get_user(token_data.username)
+    user = await get_user(token_data.username)
     if user is None:
+        auth_failures_total.inc(cause="unknown_token_user")
         raise credentials_exception
+    if user.disabled:
+        auth_failures_total.inc(cause="disabled_user")
+        raise credentials_exception
+    token_cache.put(token, payload.get("exp"), user)
+    current_user_seconds.observe(time.perf_counter() - started, cache="miss")
     return user
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """Get the authenticated user, or None for anonymous requests.
+
+    A missing, malformed or expired token counts as anonymous rather than
+    failing the request; the rejection is still counted in auth_failures_total.
+    """
+    if token is None:
+        return None
+    try:
+        return await get_current_user(token)
+    except HTTPException as e:
+        if e.status_code != 401:
+            raise
+        return None
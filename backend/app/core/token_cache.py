@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+from .config import TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_MAX_AGE_SECONDS
+
+class TokenCache:
+    """Bounded LRU cache of verified access tokens and the users they resolve to.
+
+    Entries expire at the token's ``exp`` claim, or after max_age seconds
+    so that changes made by other worker processes are picked up, and are
+    dropped immediately when invalidate_user is called for their user.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+                 max_age: float = TOKEN_CACHE_MAX_AGE_SECONDS):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        """Return the cached user for a token, or None."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, username, user = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, exp: Optional[float], user) -> None:
+        """Cache a verified token until its exp claim (capped at max_age)."""
+        expires_at = time.time() + self.max_age
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (expires_at, user.username, user)
+            self._tokens_by_user.setdefault(user.username, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, username: str) -> None:
+        """Drop every cached token of a user, e.g. after the record changed or was disabled."""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(username, ())):
+                self._remove(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[1])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[1]]
+
+token_cache = TokenCache()
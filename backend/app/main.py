@@ -1,19 +1,94 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
-from .core.config import CORS_ORIGINS
-from .routes import analysis
+from .core.config import (
+    CORS_ORIGINS,
+    MAX_UPLOAD_BYTES,
+    ANALYSIS_BATCH_MAX_IMAGES,
+    PROFILE_TOKEN,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_DIR,
+    PROFILE_INTERVAL_MS,
+    PROFILE_MIN_INTERVAL_SECONDS,
+    PROFILE_MAX_FILES,
+)
+from .routes import auth, analysis, chat, history, jobs
+from .core.token_cache import token_cache
+from .services.analysis_cache import analysis_cache
+from .services.analysis_history import analysis_history
+from .services.analysis_service import analysis_flights, parse_stats
+from .services.chat_service import chat_sessions
+from .services.image_service import warm_up_image_pool
+from .services.job_queue import job_queue
+from .services.refresh_token_service import refresh_token_store
+from .services.rate_limiter import rate_limiter
+from .services.llm_client import get_llm_backend, close_llm_backend, llm_usage_stats, llm_resilience_stats
 from .utils.logging import setup_logging
+from .utils.metrics import metrics, CONTENT_TYPE
+from .utils.profiler import ProfilingMiddleware
+from .utils.uploads import RequestBodyLimitMiddleware, FORM_OVERHEAD_BYTES
 
 # Setup logging
 logger = setup_logging()
 
+async def warm_up(app: FastAPI):
+    """Create the LLM client and prime its connections and the image workers."""
+    started = time.perf_counter()
+    try:
+        # Client construction imports the SDK, so keep it off the event loop
+        backend = await asyncio.to_thread(get_llm_backend)
+        await backend.warm_up()
+        await warm_up_image_pool()
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        return
+    app.state.ready = True
+    logger.info(f"Warm-up completed in {time.perf_counter() - started:.2f}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up shared clients in the background and close them at shutdown."""
+    app.state.ready = False
+    warm_up_task = asyncio.create_task(warm_up(app))
+    await job_queue.start()
+    await asyncio.to_thread(refresh_token_store.purge_expired)
+    await asyncio.to_thread(rate_limiter.purge)
+    yield
+    warm_up_task.cancel()
+    await job_queue.stop()
+    await close_llm_backend()
+
 app = FastAPI(
     title="Precision Health AI",
     description="AI-powered skin analysis application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+# Cap request bodies while they stream in; added before CORS so 413s still carry CORS headers
+app.add_middleware(
+    RequestBodyLimitMiddleware,
+    max_body_bytes=MAX_UPLOAD_BYTES,
+    path_limits={"/api/analyze/batch": MAX_UPLOAD_BYTES * ANALYSIS_BATCH_MAX_IMAGES},
+    overhead_bytes=FORM_OVERHEAD_BYTES
 )
 
+# Profile single requests on demand; disabled unless PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+if PROFILE_TOKEN or PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        profile_dir=PROFILE_DIR,
+        token=PROFILE_TOKEN,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        interval_ms=PROFILE_INTERVAL_MS,
+        min_interval=PROFILE_MIN_INTERVAL_SECONDS,
+        max_files=PROFILE_MAX_FILES
+    )
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -26,7 +101,29 @@ app.add_middleware(
 )
 
 # Include routers
+app.include_router(auth.router, tags=["authentication"])
 app.include_router(analysis.router, tags=["analysis"])
+app.include_router(jobs.router, tags=["jobs"])
+app.include_router(chat.router, tags=["chat"])
+app.include_router(history.router, tags=["history"])
+
+# Expose the counters the caches and services already keep
+metrics.register_stats("analysis_cache", analysis_cache.stats,
+                       counters=("hits", "disk_hits", "misses", "evictions"), gauges=("entries",))
+metrics.register_stats("analysis_singleflight", analysis_flights.stats,
+                       counters=("executions", "coalesced"), gauges=("inflight",))
+metrics.register_stats("analysis_history", analysis_history.stats, counters=("saved", "save_failures"))
+metrics.register_stats("analysis", parse_stats.stats,
+                       counters=("replies", "parse_failures", "repaired", "fallbacks"))
+metrics.register_stats("llm", llm_usage_stats, counters=("calls", "prompt_tokens", "completion_tokens"))
+metrics.register_stats("llm", llm_resilience_stats,
+                       counters=("circuit_opened", "circuit_rejected", "fallback_calls", "failures", "timeouts",
+                                 "retries", "hedged_requests", "hedge_wins"),
+                       gauges=("circuit_open",))
+metrics.register_stats("chat_sessions", chat_sessions.stats,
+                       counters=("created", "resumed", "expired", "evictions"), gauges=("active",))
+metrics.register_stats("token_cache", token_cache.stats, counters=("hits", "misses"), gauges=("entries",))
+metrics.register_stats("job_queue", lambda: {"depth": job_queue.depth}, gauges=("depth",))
 
 @app.get("/")
 async def root():
@@ -38,6 +135,23 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: warm-up has finished and traffic can be routed here."""
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metrics in the Prometheus text exposition format."""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting server...")
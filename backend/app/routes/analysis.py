@@ -1,20 +1,37 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from ..schemas.analysis import AnalysisResponse
-from ..services.analysis_service import analyze_skin_image
+import json
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from ..core.config import ANALYSIS_BATCH_MAX_IMAGES
+from ..core.security import get_optional_user
+from ..models.user import User
+from ..services.analysis_service import (
+    analyze_skin_image,
+    analyze_skin_image_stream,
+    analyze_skin_images,
+)
+from ..services.chat_service import start_chat_session
+from ..services.rate_limiter import enforce_analysis_limits, refund_analysis_quota
+from ..utils.uploads import read_upload
 
 router = APIRouter()
 
 @router.post("/api/analyze")
 async def analyze_image(
+    request: Request,
     image: UploadFile = File(...),
     name: str = Form(""),
     duration: str = Form(""),
-    symptoms: str = Form("")
+    symptoms: str = Form(""),
+    current_user: Optional[User] = Depends(get_optional_user)
 ):
     """Analyze uploaded skin image with patient information."""
-    # Read the image contents
-    contents = await image.read()
+    # Per-client rate limit and daily quota. The multipart body has already been received
+    # by now, so this saves the image work and the model call, not the upload bandwidth
+    # (RequestBodyLimitMiddleware caps that)
+    quota_key = await enforce_analysis_limits(request, current_user)
     
+    username = current_user.username if current_user else "anonymous"
     # Create patient info dict
     patient_info = {
         "name": name or "Not provided",
@@ -22,7 +39,90 @@ async def analyze_image(
         "symptoms": symptoms or "Not provided"
     }
     
-    # Call the analysis service
-    result = await analyze_skin_image(contents, "anonymous", patient_info)
+    try:
+        # Read the image contents, refusing oversized uploads with 413
+        contents = await read_upload(image)
+        # Call the analysis service
+        result = await analyze_skin_image(contents, username, patient_info)
+    except HTTPException as e:
+        # Images refused before reaching the model are not charged to the daily quota
+        await refund_analysis_quota(quota_key, e.status_code)
+        raise
     
-    return result
+    # Open a follow-up chat seeded with the result; copied since results can be shared
+    return [{**result[0], "chat_session_id": start_chat_session(username, result[0])}]
+
+@router.post("/api/analyze/stream")
+async def analyze_image_stream(
+    request: Request,
+    image: UploadFile = File(...),
+    name: str = Form(""),
+    duration: str = Form(""),
+    symptoms: str = Form(""),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """Analyze uploaded skin image, streaming progress as Server-Sent Events."""
+    quota_key = await enforce_analysis_limits(request, current_user)
+    try:
+        contents = await read_upload(image)
+    except HTTPException as e:
+        await refund_analysis_quota(quota_key, e.status_code)
+        raise
+    
+    username = current_user.username if current_user else "anonymous"
+    patient_info = {
+        "name": name or "Not provided",
+        "duration": duration or "Not provided", 
+        "symptoms": symptoms or "Not provided"
+    }
+    
+    async def event_stream():
+        async for event, data in analyze_skin_image_stream(contents, username, patient_info):
+            if event == "result":
+                data = [{**data[0], "chat_session_id": start_chat_session(username, data[0])}]
+            elif event == "error":
+                await refund_analysis_quota(quota_key, data["status_code"])
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so events reach the client as they are sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/api/analyze/batch")
+async def analyze_images_batch(
+    request: Request,
+    images: List[UploadFile] = File(...),
+    name: str = Form(""),
+    duration: str = Form(""),
+    symptoms: str = Form(""),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """Analyze several skin images of one patient; each image succeeds or fails independently."""
+    if len(images) > ANALYSIS_BATCH_MAX_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many images: at most {ANALYSIS_BATCH_MAX_IMAGES} per batch"
+        )
+    # Each image counts against the rate limit and the daily quota
+    quota_key = await enforce_analysis_limits(request, current_user, len(images))
+    
+    try:
+        uploads = [(image.filename, await read_upload(image)) for image in images]
+    except HTTPException as e:
+        await refund_analysis_quota(quota_key, *[e.status_code] * len(images))
+        raise
+    
+    username = current_user.username if current_user else "anonymous"
+    patient_info = {
+        "name": name or "Not provided",
+        "duration": duration or "Not provided", 
+        "symptoms": symptoms or "Not provided"
+    }
+    
+    results = await analyze_skin_images(uploads, username, patient_info)
+    await refund_analysis_quota(quota_key, *(result["status_code"] for result in results if not result["success"]))
+    succeeded = sum(1 for result in results if result["success"])
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, Form
+from fastapi.security import OAuth2PasswordRequestForm
+import logging
+
+from ..models.user import Token, User
+from ..schemas.user import UserSignupResponse
+from ..services.user_service import authenticate_user, create_user, get_user
+from ..services.rate_limiter import rate_limit
+from ..services.refresh_token_service import issue_refresh_token, rotate_refresh_token, revoke_refresh_token
+from ..core.security import create_access_token, get_current_user
+from ..core.config import ACCESS_TOKEN_EXPIRE_MINUTES
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/token", response_model=Token, dependencies=[Depends(rate_limit("login"))])
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    """Login endpoint to get access token."""
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+        if not user:
+            raise HTTPException(
+                status_code=401,
+                detail="Incorrect username or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": user.username}, expires_delta=access_token_expires
+        )
+        refresh_token = await issue_refresh_token(user.username)
+        logger.info(f"User {form_data.username} logged in successfully")
+        return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Login error for user {form_data.username}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error during login"
+        )
+
+@router.post("/token/refresh", response_model=Token, dependencies=[Depends(rate_limit("login"))])
+async def refresh_access_token(refresh_token: str = Form(...)):
+    """Exchange a refresh token for a new access token and a rotated refresh token."""
+    invalid_token_exception = HTTPException(
+        status_code=401,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    rotated = await rotate_refresh_token(refresh_token)
+    if rotated is None:
+        raise invalid_token_exception
+    username, new_refresh_token = rotated
+    
+    user = await get_user(username)
+    if user is None or user.disabled:
+        raise invalid_token_exception
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
+
+@router.post("/token/revoke")
+async def revoke_token(refresh_token: str = Form(...)):
+    """Log out a session by revoking its refresh token."""
+    await revoke_refresh_token(refresh_token)
+    return {"message": "Refresh token revoked"}
+
+@router.post("/signup", response_model=UserSignupResponse, dependencies=[Depends(rate_limit("signup"))])
+async def signup(
+    username: str = Form(...), 
+    password: str = Form(...), 
+    email: str = Form(...), 
+    full_name: str = Form(...)
+):
+    """Signup endpoint to create new user."""
+    try:
+        result = await create_user(username, password, email, full_name)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error during signup for user {username}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error during signup"
+        )
+
+@router.get("/users/me", response_model=User)
+async def read_users_me(current_user: User = Depends(get_current_user)):
+    """Get current user information."""
+    return current_user 
@@ -0,0 +1,43 @@
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from ..core.security import get_optional_user
+from ..models.user import User
+from ..schemas.chat import ChatRequest, ChatResponse
+from ..services.chat_service import chat_reply, chat_reply_stream
+from ..services.rate_limiter import enforce_rate_limit
+
+router = APIRouter()
+
+@router.post("/api/chat", response_model=ChatResponse)
+async def chat(
+    chat_request: ChatRequest,
+    request: Request,
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """Answer a follow-up question about a prior analysis."""
+    await enforce_rate_limit("chat", request, current_user)
+    username = current_user.username if current_user else "anonymous"
+    return await chat_reply(chat_request, username)
+
+@router.post("/api/chat/stream")
+async def chat_stream(
+    chat_request: ChatRequest,
+    request: Request,
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """Answer a follow-up question, streaming the reply as Server-Sent Events."""
+    await enforce_rate_limit("chat", request, current_user)
+    username = current_user.username if current_user else "anonymous"
+    
+    async def event_stream():
+        async for event, data in chat_reply_stream(chat_request, username):
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so events reach the client as they are sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
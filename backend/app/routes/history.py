@@ -0,0 +1,46 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from ..core.config import ANALYSIS_HISTORY_PAGE_SIZE, ANALYSIS_HISTORY_MAX_PAGE_SIZE
+from ..core.security import get_current_user
+from ..models.user import User
+from ..schemas.analysis import AnalysisPage, AnalysisRecord
+from ..services.analysis_history import (
+    InvalidCursorError,
+    get_analysis,
+    get_analysis_thumbnail,
+    list_analyses,
+)
+
+router = APIRouter()
+
+@router.get("/api/analyses", response_model=AnalysisPage)
+async def list_analysis_history(
+    cursor: Optional[str] = None,
+    limit: int = Query(ANALYSIS_HISTORY_PAGE_SIZE, ge=1, le=ANALYSIS_HISTORY_MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    """Past analyses of the current user, newest first, one page at a time."""
+    try:
+        items, next_cursor = await list_analyses(current_user.username, limit, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/api/analyses/{analysis_id}", response_model=AnalysisRecord)
+async def get_analysis_record(analysis_id: str, current_user: User = Depends(get_current_user)):
+    """One saved analysis of the current user."""
+    analysis = await get_analysis(current_user.username, analysis_id)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis
+
+@router.get("/api/analyses/{analysis_id}/thumbnail")
+async def get_analysis_thumbnail_image(analysis_id: str, current_user: User = Depends(get_current_user)):
+    """JPEG thumbnail of the image a saved analysis was made from."""
+    thumbnail = await get_analysis_thumbnail(current_user.username, analysis_id)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    # Saved analyses never change
+    return Response(content=thumbnail, media_type="image/jpeg",
+                    headers={"Cache-Control": "private, max-age=86400, immutable"})
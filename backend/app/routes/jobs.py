@@ -0,0 +1,63 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse
+from ..core.security import get_optional_user
+from ..models.user import User
+from ..services.job_queue import job_queue, QueueFullError, validate_callback_url
+from ..services.rate_limiter import enforce_analysis_limits, refund_analysis_quota
+from ..utils.uploads import read_upload
+
+router = APIRouter()
+
+@router.post("/api/jobs", status_code=202)
+async def submit_analysis_job(
+    request: Request,
+    image: UploadFile = File(...),
+    name: str = Form(""),
+    duration: str = Form(""),
+    symptoms: str = Form(""),
+    callback_url: Optional[str] = Form(None),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """Queue an image analysis and return its job id immediately."""
+    if callback_url:
+        await validate_callback_url(callback_url)
+    quota_key = await enforce_analysis_limits(request, current_user)
+    
+    try:
+        contents = await read_upload(image)
+    except HTTPException as e:
+        await refund_analysis_quota(quota_key, e.status_code)
+        raise
+    
+    username = current_user.username if current_user else "anonymous"
+    patient_info = {
+        "name": name or "Not provided",
+        "duration": duration or "Not provided", 
+        "symptoms": symptoms or "Not provided"
+    }
+    
+    try:
+        job_id = await job_queue.submit(contents, username, patient_info, callback_url, quota_key)
+    except QueueFullError as e:
+        await refund_analysis_quota(quota_key, 503)
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    return {"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}
+
+@router.get("/api/jobs/{job_id}")
+async def get_analysis_job(job_id: str, current_user: Optional[User] = Depends(get_optional_user)):
+    """Poll the status of an analysis job; finished jobs include the result or error.
+
+    Only the user who submitted a job can see it (anonymous jobs are
+    visible to anonymous callers that know the id).
+    """
+    username = current_user.username if current_user else "anonymous"
+    job = await job_queue.get(job_id, username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,5 +1,49 @@
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
-class AnalysisResponse(BaseModel):
-    analysis: str
-    success: bool
+class AnalysisResult(BaseModel):
+    """Assessment of one skin image, as the model is required to return it."""
+    model_config = ConfigDict(extra="forbid")
+
+    condition: str = Field(description="Main condition identified")
+    severity: Literal["Mild", "Moderate", "Severe"]
+    description: str = Field(description="Detailed description of the condition")
+    recommendations: List[str] = Field(description="Specific treatment recommendations")
+
+    @field_validator("severity", mode="before")
+    @classmethod
+    def normalize_severity(cls, value):
+        # Models sometimes answer "mild" or "MODERATE"
+        return value.strip().capitalize() if isinstance(value, str) else value
+
+class AnalysisSummary(BaseModel):
+    """One entry of a user's analysis history list."""
+    id: str
+    created_at: float
+    condition: str
+    severity: str
+    thumbnail_url: Optional[str] = None
+
+class AnalysisPage(BaseModel):
+    """A page of analysis history, newest first; pass next_cursor to get the following page."""
+    items: List[AnalysisSummary]
+    next_cursor: Optional[str] = None
+
+class AnalysisRecord(BaseModel):
+    """A saved analysis with the patient information it was made with."""
+    id: str
+    created_at: float
+    result: dict
+    patient_info: Optional[dict] = None
+    thumbnail_url: Optional[str] = None
+
+def analysis_response_format() -> dict:
+    """OpenAI ``response_format`` binding the reply to the AnalysisResult schema."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "skin_analysis",
+            "strict": True,
+            "schema": AnalysisResult.model_json_schema(),
+        },
+    }
@@ -0,0 +1,33 @@
+from typing import Annotated, List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from ..core.config import CHAT_MESSAGE_MAX_CHARS, CHAT_HISTORY_MAX_TURNS
+from .analysis import AnalysisResult
+
+class ChatTurn(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str = Field(max_length=CHAT_MESSAGE_MAX_CHARS)
+
+class ChatAnalysis(AnalysisResult):
+    """Analysis a rebuilt session starts from, with every field capped.
+
+    Clients send back the /api/analyze result, so the extra fields it
+    carries (ids, quality warnings) are dropped rather than refused.
+    """
+    model_config = ConfigDict(extra="ignore")
+
+    condition: str = Field(max_length=200)
+    description: str = Field(max_length=CHAT_MESSAGE_MAX_CHARS)
+    recommendations: List[Annotated[str, Field(max_length=500)]] = Field(max_length=10)
+
+class ChatRequest(BaseModel):
+    """A follow-up question, with the context to use when the session is unknown to this worker."""
+    message: str = Field(min_length=1, max_length=CHAT_MESSAGE_MAX_CHARS)
+    # Returned by /api/analyze (chat_session_id) and by every chat reply
+    session_id: Optional[str] = None
+    # Used to start a session when session_id is missing or has expired
+    history: List[ChatTurn] = Field(default_factory=list, max_length=CHAT_HISTORY_MAX_TURNS)
+    analysis: Optional[ChatAnalysis] = None
+
+class ChatResponse(BaseModel):
+    response: str
+    session_id: str
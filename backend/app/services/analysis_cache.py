@@ -0,0 +1,153 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Optional
+from ..core.config import (
+    ANALYSIS_CACHE_MAX_ENTRIES,
+    ANALYSIS_CACHE_TTL_SECONDS,
+    ANALYSIS_CACHE_DIR,
+    ANALYSIS_CACHE_DISK_MAX_ENTRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(image_bytes: bytes, patient_info: Optional[dict]) -> str:
+    """Hash the normalized image bytes together with the patient information."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(json.dumps(patient_info or {}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """LRU/TTL cache of analysis results with an optional on-disk tier.
+
+    The memory tier is only touched from the event loop; disk reads and
+    writes run in a worker thread and use atomic renames so concurrent
+    processes sharing the directory never see partial files.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANALYSIS_CACHE_TTL_SECONDS,
+                 disk_dir: Optional[str] = ANALYSIS_CACHE_DIR,
+                 disk_max_entries: int = ANALYSIS_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = pathlib.Path(disk_dir) if disk_dir else None
+        self.disk_max_entries = disk_max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    async def get(self, key: str):
+        """Return a cached result, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(value)
+            del self._entries[key]
+
+        if self.disk_dir:
+            stored = await asyncio.to_thread(self._disk_get, key)
+            if stored is not None:
+                expires_at, value = stored
+                self._remember(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return copy.deepcopy(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value) -> None:
+        """Store a result in memory and, if configured, on disk."""
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, copy.deepcopy(value), expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    def clear(self) -> None:
+        """Drop all in-memory entries."""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remember(self, key: str, value, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> pathlib.Path:
+        return self.disk_dir / f"{key}.json"
+
+    def _disk_get(self, key: str):
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error reading analysis cache entry {key}: {str(e)}")
+            return None
+        if stored.get("expires_at", 0) <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return stored["expires_at"], stored["value"]
+
+    def _disk_set(self, key: str, value, expires_at: float) -> None:
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Error writing analysis cache entry {key}: {str(e)}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Remove expired files and the oldest ones beyond the disk limit."""
+        now = time.time()
+        files = []
+        for path in self.disk_dir.glob("*.json"):
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if mtime + self.ttl_seconds <= now:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((mtime, path))
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.disk_max_entries)]:
+            path.unlink(missing_ok=True)
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+from ..core.config import ANALYSIS_HISTORY_DB_PATH
+from ..utils.sqlite import ProcessLocalConnection
+
+logger = logging.getLogger(__name__)
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor was not issued by AnalysisHistoryStore."""
+
+def encode_cursor(created_at: float, analysis_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, analysis_id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        created_at, analysis_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(created_at), str(analysis_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+class AnalysisHistoryStore:
+    """SQLite store of finished analyses per user, each with a thumbnail of its image.
+
+    Pages are read newest first with keyset pagination on the
+    (username, created_at, id) index: the cursor is the position of the
+    last row returned, so every page is one index range scan whatever
+    the length of the history, instead of an OFFSET that skips rows.
+    """
+
+    def __init__(self, path=ANALYSIS_HISTORY_DB_PATH):
+        self.path = path
+        self._db = ProcessLocalConnection(path, self._create_schema, row_factory=True)
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.save_failures = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        # The thumbnail is the last column so reading the other fields never touches its overflow pages
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS analyses (
+                id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                result TEXT NOT NULL,
+                patient_info TEXT,
+                thumbnail BLOB
+            )"""
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_analyses_user_created ON analyses (username, created_at, id)"
+        )
+
+    def add(self, username: str, result: dict, patient_info: Optional[dict], thumbnail: Optional[bytes]) -> str:
+        """Save a finished analysis and return its id."""
+        analysis_id = uuid.uuid4().hex
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO analyses (id, username, created_at, result, patient_info, thumbnail) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (analysis_id, username, time.time(), json.dumps(result), json.dumps(patient_info), thumbnail),
+            )
+        return analysis_id
+
+    def list(self, username: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Return up to limit analyses of a user, newest first, and the cursor of the next page."""
+        params: tuple = (username,)
+        after = ""
+        if cursor:
+            after = "AND (created_at, id) < (?, ?)"
+            params += decode_cursor(cursor)
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT id, created_at, result, thumbnail IS NOT NULL AS has_thumbnail FROM analyses "
+                f"WHERE username = ? {after} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+        items = [self._summary(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
+        return items, next_cursor
+
+    def get(self, username: str, analysis_id: str) -> Optional[dict]:
+        """Return one analysis of a user, or None if it does not exist or belongs to someone else."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, created_at, result, patient_info, thumbnail IS NOT NULL AS has_thumbnail "
+                "FROM analyses WHERE id = ? AND username = ?",
+                (analysis_id, username),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "result": json.loads(row["result"]),
+            "patient_info": json.loads(row["patient_info"]),
+            "thumbnail_url": self._thumbnail_url(row),
+        }
+
+    def get_thumbnail(self, username: str, analysis_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT thumbnail FROM analyses WHERE id = ? AND username = ?", (analysis_id, username)
+            ).fetchone()
+        return row["thumbnail"] if row is not None else None
+
+    @staticmethod
+    def _thumbnail_url(row: sqlite3.Row) -> Optional[str]:
+        return f"/api/analyses/{row['id']}/thumbnail" if row["has_thumbnail"] else None
+
+    def _summary(self, row: sqlite3.Row) -> dict:
+        result = json.loads(row["result"])
+        return {
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "condition": result.get("condition", ""),
+            "severity": result.get("severity", ""),
+            "thumbnail_url": self._thumbnail_url(row),
+        }
+
+    def stats(self) -> dict:
+        return {"saved": self.saved, "save_failures": self.save_failures}
+
+analysis_history = AnalysisHistoryStore()
+
+async def record_analysis(username: str, result: dict, patient_info: Optional[dict],
+                          thumbnail: Optional[bytes]) -> Optional[str]:
+    """Save an analysis to the user's history; returns its id, or None if saving failed.
+
+    A failed save is logged and does not fail the analysis it belongs to.
+    """
+    try:
+        analysis_id = await asyncio.to_thread(analysis_history.add, username, result, patient_info, thumbnail)
+    except Exception as e:
+        analysis_history.save_failures += 1
+        logger.error(f"Error saving analysis history for user {username}: {str(e)}")
+        return None
+    analysis_history.saved += 1
+    return analysis_id
+
+async def list_analyses(username: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    return await asyncio.to_thread(analysis_history.list, username, limit, cursor)
+
+async def get_analysis(username: str, analysis_id: str) -> Optional[dict]:
+    return await asyncio.to_thread(analysis_history.get, username, analysis_id)
+
+async def get_analysis_thumbnail(username: str, analysis_id: str) -> Optional[bytes]:
+    return await asyncio.to_thread(analysis_history.get_thumbnail, username, analysis_id)
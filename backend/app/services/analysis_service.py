@@ -1,143 +1,409 @@
-import torch
-import torchvision.transforms as transforms
-from PIL import Image
-import io
-import base64
+import asyncio
 import logging
-import json
-import re
-from langchain_openai import ChatOpenAI
-from langchain.schema.messages import HumanMessage, SystemMessage
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
 from fastapi import HTTPException
+from pydantic import ValidationError
+from ..core.config import (
+    ANALYSIS_MAX_CONCURRENCY,
+    ANALYSIS_BATCH_CONCURRENCY,
+    ANALYSIS_CACHE_ENABLED,
+    ANALYSIS_HISTORY_ENABLED,
+    ANALYSIS_MAX_TOKENS,
+    LLM_RESPONSE_FORMAT,
+    QUALITY_GATE_MODE,
+)
+from ..core.metrics import analysis_stage_seconds, analyses_in_flight, analyses_waiting, analysis_errors_total
+from ..schemas.analysis import AnalysisResult, analysis_response_format
+from .analysis_cache import analysis_cache, make_cache_key
+from .analysis_history import record_analysis
+from .image_service import (
+    EncodedImage,
+    encode_for_model,
+    run_in_image_pool,
+    to_base64,
+    InvalidImageError,
+    ImageTooLargeError,
+)
+from .llm_client import ChatResult, LLMError, LLMTimeoutError, LLMUnavailableError, get_llm_backend
+from .singleflight import SingleFlight
+from ..utils.json_stream import IncrementalJSONObjectParser
+from ..utils.memory import peak_rss_bytes
 
 logger = logging.getLogger(__name__)
 
+# Caps the number of analyses in flight on this worker
+_analysis_slots = asyncio.Semaphore(ANALYSIS_MAX_CONCURRENCY)
+
+# Concurrent requests for the same image and patient info share one model call
+analysis_flights = SingleFlight()
+
+SYSTEM_PROMPT = (
+    "You are a dermatologist specialized in analyzing skin conditions. "
+    "Assess the skin image: name the main condition, rate its severity, describe it clearly "
+    "and give specific treatment recommendations."
+)
+# Only needed when the API does not enforce the schema itself
+JSON_FORMAT_HINT = (
+    " Reply with a JSON object with the keys condition, severity (Mild, Moderate or Severe), "
+    "description and recommendations (a list of strings)."
+)
+REPAIR_PROMPT = (
+    "Rewrite the dermatology assessment below as the requested JSON object. "
+    "Keep its content and do not add findings."
+)
+
+class ParseStats:
+    """Counts of model replies that did not match the analysis schema."""
+
+    def __init__(self):
+        self.replies = 0
+        self.parse_failures = 0
+        self.repaired = 0
+        self.fallbacks = 0
+
+    def stats(self) -> dict:
+        return {
+            "replies": self.replies,
+            "parse_failures": self.parse_failures,
+            "repaired": self.repaired,
+            "fallbacks": self.fallbacks,
+            "parse_failure_rate": round(self.parse_failures / self.replies, 4) if self.replies else 0.0,
+        }
+
+parse_stats = ParseStats()
+
+def _response_format() -> Optional[dict]:
+    if LLM_RESPONSE_FORMAT == "json_schema":
+        return analysis_response_format()
+    if LLM_RESPONSE_FORMAT == "json_object":
+        return {"type": "json_object"}
+    return None
+
+async def _call_model(messages: list, username: str, stage: str = "llm") -> ChatResult:
+    """Run one structured-output chat completion and log its token usage."""
+    started = time.perf_counter()
+    response = await get_llm_backend().chat(
+        messages, max_tokens=ANALYSIS_MAX_TOKENS, temperature=0, response_format=_response_format()
+    )
+    elapsed = time.perf_counter() - started
+    analysis_stage_seconds.observe(elapsed, stage=stage)
+    logger.info(
+        f"Model call for user {username}: {response.prompt_tokens} prompt + "
+        f"{response.completion_tokens} completion tokens in {elapsed:.2f}s"
+    )
+    return response
+
+def model_http_error(error: LLMError, username: str, errors_total=analysis_errors_total) -> HTTPException:
+    """Map a failed model call to 504 (timed out), 503 (unavailable) or 502 (rejected), counting its cause."""
+    logger.error(f"Model call failed for user {username}: {str(error)}")
+    if isinstance(error, LLMTimeoutError):
+        errors_total.inc(cause="llm_timeout")
+        return HTTPException(status_code=504, detail="The analysis model did not respond in time")
+    if isinstance(error, LLMUnavailableError):
+        errors_total.inc(cause="llm_unavailable")
+        return HTTPException(
+            status_code=503,
+            detail="The analysis model is temporarily unavailable",
+            headers={"Retry-After": str(max(1, math.ceil(error.retry_after or 30)))}
+        )
+    errors_total.inc(cause="llm_error")
+    return HTTPException(status_code=502, detail="The analysis model could not process the request")
+
+@asynccontextmanager
+async def _analysis_slot():
+    """Hold one of the worker's analysis slots, tracking waiting and running analyses."""
+    with analyses_waiting.track_inprogress():
+        await _analysis_slots.acquire()
+    try:
+        with analyses_in_flight.track_inprogress():
+            yield
+    finally:
+        _analysis_slots.release()
+
 async def analyze_skin_image(image_contents: bytes, username: str, patient_info: dict = None) -> list:
     """Analyze skin image using AI model."""
+    async with _analysis_slot():
+        return await _analyze_skin_image(image_contents, username, patient_info)
+
+async def _analyze_skin_image(image_contents: bytes, username: str, patient_info: dict = None) -> list:
     try:
         # Log the analysis request
         logger.info(f"Analysis request received from user: {username}")
         
-        # Process the image
-        pil_image = Image.open(io.BytesIO(image_contents))
-        
-        # Convert to RGB if necessary
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # Prepare the image for analysis
-        transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-        ])
-        
-        image_tensor = transform(pil_image)
-        image_tensor = image_tensor.unsqueeze(0)  # Add batch dimension
+        cache_key, cached_result, encoded, quality_warnings = await _prepare_analysis(
+            image_contents, username, patient_info
+        )
+        if cached_result is not None:
+            return await _record_history(cached_result, username, patient_info, encoded)
         
-        # Convert the image to base64 for the API
-        buffered = io.BytesIO()
-        pil_image.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        async def run_model() -> list:
+            messages = await _build_messages(encoded, patient_info)
+            
+            # Get the analysis from the shared, pooled LLM client
+            response = await _call_model(messages, username)
+            
+            result = await _finish_analysis(response.content, cache_key, username, quality_warnings)
+            
+            # Log successful analysis
+            logger.info(f"Analysis completed successfully for user: {username}")
+            
+            return result
         
-        # Initialize OpenAI client
-        llm = ChatOpenAI(
-            model="gpt-4o",
-            max_tokens=2000,
-            temperature=0
-        )
+        result = await analysis_flights.do(cache_key, run_model)
+        return await _record_history(result, username, patient_info, encoded)
         
-        # Create enhanced prompt with patient information
-        patient_context = ""
-        if patient_info:
-            patient_context = f"""
+    except HTTPException:
+        raise
+    except LLMError as e:
+        raise model_http_error(e, username) from e
+    except Exception as e:
+        # Log the error
+        logger.error(f"Error during analysis for user {username}: {str(e)}")
+        analysis_errors_total.inc(cause="internal")
+        raise HTTPException(status_code=500, detail="Internal error during analysis")
+
+async def analyze_skin_images(images: List[Tuple[str, bytes]], username: str, patient_info: dict = None,
+                              concurrency: int = ANALYSIS_BATCH_CONCURRENCY) -> List[dict]:
+    """Analyze several images concurrently, returning one entry per image in input order.
+
+    A failure only affects its own entry, so one bad image does not fail
+    the whole batch.
+    """
+    batch_slots = asyncio.Semaphore(concurrency)
+    
+    async def analyze_one(filename: str, contents: bytes) -> dict:
+        async with batch_slots:
+            try:
+                analysis = await analyze_skin_image(contents, username, patient_info)
+                return {"filename": filename, "success": True, "analysis": analysis}
+            except HTTPException as e:
+                return {"filename": filename, "success": False, "status_code": e.status_code, "error": e.detail}
+    
+    logger.info(f"Batch analysis of {len(images)} images requested by user: {username}")
+    return await asyncio.gather(*(analyze_one(filename, contents) for filename, contents in images))
+
+async def analyze_skin_image_stream(image_contents: bytes, username: str,
+                                    patient_info: dict = None) -> AsyncIterator[Tuple[str, object]]:
+    """Analyze skin image, yielding (event, data) pairs as the model output arrives.
+
+    Events are ``token`` for raw text deltas, ``field`` once a top-level
+    field of the JSON answer is complete, and finally ``result`` carrying
+    the same ``[analysis_result]`` list that analyze_skin_image returns.
+    Errors are reported as an ``error`` event since the response has
+    already started.
+    """
+    async with _analysis_slot():
+        try:
+            logger.info(f"Streaming analysis request received from user: {username}")
+            yield "status", {"stage": "processing"}
+            
+            cache_key, cached_result, encoded, quality_warnings = await _prepare_analysis(
+                image_contents, username, patient_info
+            )
+            for warning in quality_warnings:
+                yield "warning", {"detail": warning}
+            if cached_result is not None:
+                for name, value in cached_result[0].items():
+                    yield "field", {"name": name, "value": value}
+                yield "result", await _record_history(cached_result, username, patient_info, encoded)
+                return
+            
+            messages = await _build_messages(encoded, patient_info)
+            parser = IncrementalJSONObjectParser()
+            chunks = []
+            started = time.perf_counter()
+            async for delta in get_llm_backend().stream(
+                messages, max_tokens=ANALYSIS_MAX_TOKENS, temperature=0, response_format=_response_format()
+            ):
+                chunks.append(delta)
+                yield "token", {"text": delta}
+                for name, value in parser.feed(delta):
+                    yield "field", {"name": name, "value": value}
+            analysis_stage_seconds.observe(time.perf_counter() - started, stage="llm")
+            
+            result = await _finish_analysis("".join(chunks), cache_key, username, quality_warnings)
+            logger.info(f"Streaming analysis completed successfully for user: {username}")
+            yield "result", await _record_history(result, username, patient_info, encoded)
+            
+        except HTTPException as e:
+            yield "error", {"status_code": e.status_code, "detail": e.detail}
+        except LLMError as e:
+            error = model_http_error(e, username)
+            yield "error", {"status_code": error.status_code, "detail": error.detail}
+        except Exception as e:
+            logger.error(f"Error during streaming analysis for user {username}: {str(e)}")
+            analysis_errors_total.inc(cause="internal")
+            yield "error", {"status_code": 500, "detail": "Internal error during analysis"}
+
+async def _prepare_analysis(image_contents: bytes, username: str,
+                            patient_info: Optional[dict]) -> Tuple[str, Optional[list], EncodedImage, List[str]]:
+    """Encode and quality-check the image, and look up a cached result.
+
+    Returns the cache key, the cached result (None on a miss), the
+    encoded image and any quality warnings.
+
+    Raises HTTPException(413) for images over IMAGE_MAX_PIXELS and
+    HTTPException(422) for uploads that are not images or, in "reject"
+    mode, that fail the quality gate.
+    """
+    # Decode, check, downscale and encode the image off the event loop
+    try:
+        encoded = await run_in_image_pool(encode_for_model, image_contents)
+    except ImageTooLargeError as e:
+        analysis_errors_total.inc(cause="image_too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImageError as e:
+        analysis_errors_total.inc(cause="invalid_image")
+        raise HTTPException(status_code=422, detail=str(e))
+    for stage, seconds in encoded.timings.items():
+        analysis_stage_seconds.observe(seconds, stage=stage)
+    # Upload, decoded pixels and re-encoded JPEG are what one request holds at its peak
+    peak_bytes = len(image_contents) + encoded.decoded_bytes + encoded.size
+    logger.info(
+        f"Encoded image for user {username}: {encoded.original_width}x{encoded.original_height} "
+        f"-> {encoded.width}x{encoded.height}, {len(image_contents)} -> {encoded.size} bytes, "
+        f"~{peak_bytes / 2**20:.1f} MiB peak image memory (process peak RSS {peak_rss_bytes() / 2**20:.0f} MiB)"
+    )
+    
+    # Refuse unusable images before paying for the model call
+    quality_warnings = []
+    if encoded.quality is not None:
+        logger.info(f"Image quality for user {username}: {encoded.quality.metrics}")
+        quality_warnings = list(encoded.quality.warnings)
+        if not encoded.quality.ok:
+            if QUALITY_GATE_MODE == "reject":
+                logger.info(f"Image rejected for user {username}: {'; '.join(encoded.quality.reasons)}")
+                analysis_errors_total.inc(cause="quality_rejected")
+                raise HTTPException(status_code=422, detail="; ".join(encoded.quality.reasons))
+            quality_warnings = encoded.quality.reasons + quality_warnings
+    
+    # Serve repeated uploads of the same image from the cache
+    cache_key = make_cache_key(encoded.jpeg_bytes, patient_info)
+    if ANALYSIS_CACHE_ENABLED:
+        cached_result = await analysis_cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"Analysis served from cache for user: {username}")
+            return cache_key, cached_result, encoded, quality_warnings
+    
+    return cache_key, None, encoded, quality_warnings
+
+async def _record_history(result: list, username: str, patient_info: Optional[dict], encoded: EncodedImage) -> list:
+    """Save a signed-in user's analysis to their history and return the result with its ``analysis_id``.
+
+    The result may be shared with the cache and coalesced requests, so
+    a copy is returned rather than the original changed.
+    """
+    if not ANALYSIS_HISTORY_ENABLED or username == "anonymous":
+        return result
+    analysis_id = await record_analysis(username, result[0], patient_info, encoded.thumbnail)
+    if analysis_id is None:
+        return result
+    return [{**result[0], "analysis_id": analysis_id}]
+
+async def _build_messages(encoded: EncodedImage, patient_info: Optional[dict]) -> list:
+    """Build the chat messages carrying the encoded image and patient information."""
+    with analysis_stage_seconds.time(stage="base64"):
+        img_str = await run_in_image_pool(to_base64, encoded.jpeg_bytes)
+    
+    # Create enhanced prompt with patient information
+    patient_context = ""
+    if patient_info:
+        patient_context = f"""
 Patient Information:
 - Name: {patient_info.get('name', 'Not provided')}
 - Symptoms Duration: {patient_info.get('duration', 'Not provided')}
 - Symptoms Description: {patient_info.get('symptoms', 'Not provided')}
 """
-        
-        # Create the messages for the API
-        messages = [
-            SystemMessage(content=(
-                "You are a dermatologist specialized in analyzing skin conditions. "
-                "Analyze the skin image and provide a detailed assessment in a structured format. "
-                "Your response must be a JSON object with the following structure: "
-                "{"
-                '  "condition": "main condition identified",'
-                '  "severity": "Mild/Moderate/Severe",'
-                '  "description": "detailed description of the condition",'
-                '  "recommendations": ["recommendation 1", "recommendation 2", "recommendation 3"]'
-                "}"
-                "Be thorough but clear. Include specific treatment recommendations."
-            )),
-            HumanMessage(content=[
-                {
-                    "type": "text",
-                    "text": f"Please analyze this skin image and provide a detailed assessment.{patient_context}"
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}
-                }
-            ])
-        ]
-        
-        # Get the analysis from the API
-        response = llm.invoke(messages)
-        
-        # Log successful analysis
-        logger.info(f"Analysis completed successfully for user: {username}")
-        
-        # Parse the AI response to extract structured data
-        ai_response = response.content.strip()
-        
-        try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                parsed_result = json.loads(json_str)
-                
-                # Ensure all required fields are present
-                analysis_result = {
-                    "condition": parsed_result.get("condition", "Skin condition identified"),
-                    "severity": parsed_result.get("severity", "Moderate"),
-                    "description": parsed_result.get("description", ai_response),
-                    "recommendations": parsed_result.get("recommendations", [
-                        "Consult with a dermatologist for proper diagnosis",
-                        "Keep the affected area clean and dry",
-                        "Avoid irritating products"
-                    ])
-                }
-            else:
-                # Fallback: create structured response from unstructured text
-                analysis_result = {
-                    "condition": "Dermatological Assessment",
-                    "severity": "Moderate",
-                    "description": ai_response,
-                    "recommendations": [
-                        "Consult with a dermatologist for proper diagnosis",
-                        "Follow a gentle skincare routine",
-                        "Monitor the condition for changes"
-                    ]
-                }
-        except json.JSONDecodeError:
-            # Fallback for non-JSON responses
-            analysis_result = {
-                "condition": "Dermatological Assessment", 
-                "severity": "Moderate",
-                "description": ai_response,
-                "recommendations": [
-                    "Consult with a dermatologist for proper diagnosis",
-                    "Follow a gentle skincare routine", 
-                    "Monitor the condition for changes"
-                ]
+    
+    # Create the messages for the API; with json_schema the API enforces the reply format
+    system_prompt = SYSTEM_PROMPT if LLM_RESPONSE_FORMAT == "json_schema" else SYSTEM_PROMPT + JSON_FORMAT_HINT
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": [
+            {
+                "type": "text",
+                "text": f"Please analyze this skin image and provide a detailed assessment.{patient_context}"
+            },
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}
             }
-        
-        # Return as an array to match frontend expectations
-        return [analysis_result]
-        
-    except Exception as e:
-        # Log the error
-        logger.error(f"Error during analysis for user {username}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        ]}
+    ]
+    return messages
+
+def _parse_analysis(content: str) -> Optional[AnalysisResult]:
+    """Validate a model reply against AnalysisResult, or return None.
+
+    The incremental parser skips text around the JSON object, such as
+    markdown fences, and keeps the fields completed before a reply was
+    cut off, so only replies missing required fields fail.
+    """
+    fields = dict(IncrementalJSONObjectParser().feed(content))
+    try:
+        return AnalysisResult.model_validate(fields)
+    except ValidationError:
+        return None
+
+async def _repair_analysis(content: str, username: str) -> Optional[AnalysisResult]:
+    """Ask the model once to reformat a reply that failed validation.
+
+    The repair call only carries the previous reply, not the image, so it
+    costs a fraction of the original prompt.
+    """
+    messages = [
+        {"role": "system", "content": REPAIR_PROMPT + JSON_FORMAT_HINT},
+        {"role": "user", "content": content},
+    ]
+    response = await _call_model(messages, username, stage="llm_repair")
+    with analysis_stage_seconds.time(stage="parse"):
+        return _parse_analysis(response.content)
+
+async def _finish_analysis(content: str, cache_key: str, username: str, quality_warnings: List[str] = None) -> list:
+    """Parse the model reply into the result list and cache it."""
+    ai_response = content.strip()
+    
+    parse_stats.replies += 1
+    with analysis_stage_seconds.time(stage="parse"):
+        parsed_result = _parse_analysis(ai_response)
+    if parsed_result is None:
+        parse_stats.parse_failures += 1
+        logger.warning(f"Model reply for user {username} did not match the analysis schema")
+        if ai_response:
+            try:
+                parsed_result = await _repair_analysis(ai_response, username)
+            except LLMError as e:
+                # The original reply is still usable as the fallback description
+                logger.warning(f"Repair call failed for user {username}: {str(e)}")
+            if parsed_result is not None:
+                parse_stats.repaired += 1
+    
+    # Canned fallbacks are not cached so a retry gets a fresh answer
+    cacheable = parsed_result is not None
+    if parsed_result is not None:
+        analysis_result = parsed_result.model_dump()
+    else:
+        # Fallback: create structured response from unstructured text
+        parse_stats.fallbacks += 1
+        analysis_result = {
+            "condition": "Dermatological Assessment",
+            "severity": "Moderate",
+            "description": ai_response,
+            "recommendations": [
+                "Consult with a dermatologist for proper diagnosis",
+                "Follow a gentle skincare routine",
+                "Monitor the condition for changes"
+            ]
+        }
+    
+    if quality_warnings:
+        analysis_result["quality_warnings"] = quality_warnings
+    
+    if ANALYSIS_CACHE_ENABLED and cacheable:
+        await analysis_cache.set(cache_key, [analysis_result])
+    
+    # Return as an array to match frontend expectations
+    return [analysis_result]
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple
+from ..core.config import (
+    CHAT_SESSION_MAX,
+    CHAT_SESSION_TTL_SECONDS,
+    CHAT_HISTORY_MAX_TOKENS,
+    CHAT_SUMMARY_MAX_TOKENS,
+    CHAT_MAX_TOKENS,
+)
+from ..core.metrics import chat_reply_seconds, chat_errors_total
+from ..schemas.chat import ChatRequest
+from .analysis_service import model_http_error
+from .llm_client import LLMError, get_llm_backend
+
+logger = logging.getLogger(__name__)
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a dermatology assistant answering follow-up questions about a skin analysis. "
+    "Answer concisely and practically, say when something needs an in-person examination, "
+    "and do not claim more certainty than the analysis supports."
+)
+CHAT_TEMPERATURE = 0.3
+
+# Fields of the analysis result the model needs; quality warnings and ids are left out
+ANALYSIS_FIELDS = ("condition", "severity", "description", "recommendations")
+# Characters of each older turn kept in the conversation summary
+SUMMARY_TURN_CHARS = 200
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text, plus per-message overhead
+    return len(text) // 4 + 4
+
+@dataclass
+class ChatSession:
+    """Context of one follow-up conversation: the analysis and the turns so far.
+
+    Turns that no longer fit the history budget are folded into
+    ``summary``, so a turn never resends more than the budget and the
+    image itself is never resent.
+    """
+    id: str
+    username: str
+    analysis: Optional[dict] = None
+    summary: str = ""
+    turns: List[dict] = field(default_factory=list)
+    # Turns of one session are answered one at a time
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def trim(self, budget: int = CHAT_HISTORY_MAX_TOKENS, summary_budget: int = CHAT_SUMMARY_MAX_TOKENS) -> None:
+        """Move the oldest turns into the summary until the remaining turns fit the budget."""
+        total = sum(estimate_tokens(turn["content"]) for turn in self.turns)
+        dropped = []
+        while self.turns and total > budget:
+            turn = self.turns.pop(0)
+            total -= estimate_tokens(turn["content"])
+            text = " ".join(turn["content"].split())
+            if len(text) > SUMMARY_TURN_CHARS:
+                text = text[:SUMMARY_TURN_CHARS] + "..."
+            dropped.append(f"{'Patient' if turn['role'] == 'user' else 'Assistant'}: {text}")
+        if not dropped:
+            return
+        lines = (self.summary.splitlines() if self.summary else []) + dropped
+        # Keep the most recent lines within the summary budget
+        while lines and estimate_tokens("\n".join(lines)) > summary_budget:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+    def messages(self, message: str) -> List[dict]:
+        """Chat messages for the next model call: context, recent turns and the new question."""
+        system_prompt = CHAT_SYSTEM_PROMPT
+        if self.analysis:
+            system_prompt += "\n\nAnalysis of the patient's skin image:\n" + json.dumps(self.analysis, separators=(",", ":"))
+        if self.summary:
+            system_prompt += "\n\nEarlier in this conversation (abridged):\n" + self.summary
+        return [{"role": "system", "content": system_prompt}, *self.turns, {"role": "user", "content": message}]
+
+class ChatSessionStore:
+    """LRU/TTL store of chat sessions in worker memory.
+
+    Sessions expire after ``ttl_seconds`` without a turn. A session is
+    only found by the worker that holds it; elsewhere the client's
+    history and analysis start a new one, so a miss costs context
+    fidelity, not correctness.
+    """
+
+    def __init__(self, max_sessions: int = CHAT_SESSION_MAX, ttl_seconds: float = CHAT_SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Tuple[float, ChatSession]]" = OrderedDict()
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def create(self, username: str, analysis: Optional[dict] = None, history: List[dict] = ()) -> ChatSession:
+        """Start a session, keeping only the analysis fields the model needs."""
+        if analysis:
+            analysis = {name: analysis[name] for name in ANALYSIS_FIELDS if name in analysis} or None
+        session = ChatSession(id=secrets.token_urlsafe(16), username=username, analysis=analysis,
+                              turns=[dict(turn) for turn in history])
+        session.trim()
+        self._sessions[session.id] = (time.monotonic() + self.ttl_seconds, session)
+        self.created += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        return session
+
+    def get(self, session_id: str, username: str) -> Optional[ChatSession]:
+        """Return a live session of this user and extend its lifetime, or None."""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        expires_at, session = entry
+        if expires_at <= time.monotonic():
+            del self._sessions[session_id]
+            self.expired += 1
+            return None
+        if session.username != username:
+            return None
+        self._sessions[session_id] = (time.monotonic() + self.ttl_seconds, session)
+        self._sessions.move_to_end(session_id)
+        self.resumed += 1
+        return session
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._sessions),
+            "created": self.created,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+chat_sessions = ChatSessionStore()
+
+def start_chat_session(username: str, analysis: dict) -> str:
+    """Open a follow-up session seeded with an analysis result and return its id."""
+    return chat_sessions.create(username, analysis).id
+
+def _open_session(request: ChatRequest, username: str) -> ChatSession:
+    if request.session_id:
+        session = chat_sessions.get(request.session_id, username)
+        if session is not None:
+            return session
+        logger.info(f"Chat session for user {username} not found; starting one from the client history")
+    history = [turn.model_dump() for turn in request.history]
+    analysis = request.analysis.model_dump() if request.analysis else None
+    return chat_sessions.create(username, analysis, history)
+
+def _record_turn(session: ChatSession, message: str, reply: str, started: float) -> None:
+    session.turns.append({"role": "user", "content": message})
+    session.turns.append({"role": "assistant", "content": reply})
+    session.trim()
+    chat_reply_seconds.observe(time.perf_counter() - started)
+
+async def chat_reply(request: ChatRequest, username: str) -> dict:
+    """Answer a follow-up question within its session's context."""
+    session = _open_session(request, username)
+    async with session.lock:
+        messages = session.messages(request.message)
+        started = time.perf_counter()
+        try:
+            response = await get_llm_backend().chat(messages, max_tokens=CHAT_MAX_TOKENS, temperature=CHAT_TEMPERATURE)
+        except LLMError as e:
+            raise model_http_error(e, username, chat_errors_total) from e
+        reply = response.content.strip()
+        _record_turn(session, request.message, reply, started)
+    logger.info(
+        f"Chat reply for user {username}: {response.prompt_tokens} prompt + "
+        f"{response.completion_tokens} completion tokens in {time.perf_counter() - started:.2f}s"
+    )
+    return {"response": reply, "session_id": session.id}
+
+async def chat_reply_stream(request: ChatRequest, username: str) -> AsyncIterator[Tuple[str, object]]:
+    """Answer a follow-up question, yielding (event, data) pairs as the reply is generated.
+
+    Events are ``session`` with the session id, ``token`` for text
+    deltas, then ``done`` with the full reply, or ``error``.
+    """
+    session = _open_session(request, username)
+    yield "session", {"session_id": session.id}
+    async with session.lock:
+        messages = session.messages(request.message)
+        chunks = []
+        started = time.perf_counter()
+        try:
+            async for delta in get_llm_backend().stream(
+                messages, max_tokens=CHAT_MAX_TOKENS, temperature=CHAT_TEMPERATURE
+            ):
+                chunks.append(delta)
+                yield "token", {"text": delta}
+        except LLMError as e:
+            error = model_http_error(e, username, chat_errors_total)
+            yield "error", {"status_code": error.status_code, "detail": error.detail}
+            return
+        reply = "".join(chunks).strip()
+        _record_turn(session, request.message, reply, started)
+    yield "done", {"response": reply, "session_id": session.id}
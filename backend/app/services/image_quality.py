@@ -0,0 +1,81 @@
+import time
+from dataclasses import dataclass, field
+from typing import List
+import numpy as np
+from PIL import Image
+from ..core.config import (
+    QUALITY_MIN_RESOLUTION,
+    QUALITY_MIN_SHARPNESS,
+    QUALITY_MIN_BRIGHTNESS,
+    QUALITY_MAX_BRIGHTNESS,
+    QUALITY_MIN_SKIN_FRACTION,
+)
+
+# Long edge of the downscaled copy the checks run on, so metrics do not depend on upload size
+CHECK_SIZE = 512
+
+@dataclass
+class QualityReport:
+    """Outcome of the local image pre-check."""
+    reasons: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    metrics: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.reasons
+
+def check_image_quality(pil_image: Image.Image, original_size=None) -> QualityReport:
+    """Check resolution, sharpness, exposure and skin content of an RGB image.
+
+    Runs on a small grayscale copy and takes a few milliseconds. Problems
+    that make an analysis pointless go in ``reasons``; softer signals,
+    such as little skin-coloured area, go in ``warnings``.
+    """
+    import cv2
+
+    started = time.perf_counter()
+    report = QualityReport()
+    width, height = original_size or pil_image.size
+
+    if min(width, height) < QUALITY_MIN_RESOLUTION:
+        report.reasons.append(
+            f"Image resolution {width}x{height} is too low; the shorter side must be at least "
+            f"{QUALITY_MIN_RESOLUTION} pixels"
+        )
+
+    # Integer box reduction is much cheaper than a filtered resize and is enough for these statistics
+    factor = max(1, -(-max(pil_image.size) // CHECK_SIZE))
+    small = pil_image.reduce(factor) if factor > 1 else pil_image
+    rgb = np.asarray(small)
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+
+    # Variance of the Laplacian: low values mean few edges, i.e. a blurry photo
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    if sharpness < QUALITY_MIN_SHARPNESS:
+        report.reasons.append(f"Image is too blurry (sharpness {sharpness:.1f}, minimum {QUALITY_MIN_SHARPNESS:g})")
+
+    brightness = float(gray.mean())
+    if brightness < QUALITY_MIN_BRIGHTNESS:
+        report.reasons.append(f"Image is too dark (brightness {brightness:.0f}, minimum {QUALITY_MIN_BRIGHTNESS:g})")
+    elif brightness > QUALITY_MAX_BRIGHTNESS:
+        report.reasons.append(
+            f"Image is overexposed (brightness {brightness:.0f}, maximum {QUALITY_MAX_BRIGHTNESS:g})"
+        )
+
+    # Classic YCrCb skin-tone range; only a hint, so it never rejects on its own
+    ycrcb = cv2.cvtColor(rgb, cv2.COLOR_RGB2YCrCb)
+    skin_mask = cv2.inRange(ycrcb, (0, 133, 77), (255, 173, 127))
+    skin_fraction = float(np.count_nonzero(skin_mask)) / skin_mask.size
+    if skin_fraction < QUALITY_MIN_SKIN_FRACTION:
+        report.warnings.append("Little skin-coloured area detected; make sure the photo shows the affected skin")
+
+    report.metrics = {
+        "width": width,
+        "height": height,
+        "sharpness": round(sharpness, 1),
+        "brightness": round(brightness, 1),
+        "skin_fraction": round(skin_fraction, 3),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    return report
@@ -0,0 +1,170 @@
+import asyncio
+import base64
+import io
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+from PIL import Image, ImageOps, UnidentifiedImageError
+from ..core.config import (
+    IMAGE_WORKER_THREADS,
+    IMAGE_MAX_EDGE,
+    IMAGE_JPEG_QUALITY,
+    IMAGE_MAX_PIXELS,
+    QUALITY_GATE_MODE,
+    ANALYSIS_HISTORY_ENABLED,
+    ANALYSIS_HISTORY_THUMBNAIL_EDGE,
+)
+from .image_quality import QualityReport, check_image_quality
+
+logger = logging.getLogger(__name__)
+
+class InvalidImageError(ValueError):
+    """Raised when an upload cannot be decoded as an image."""
+
+class ImageTooLargeError(InvalidImageError):
+    """Raised when an image has more pixels than IMAGE_MAX_PIXELS allows."""
+
+# PIL refuses to open images far above this size (decompression bombs)
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+# Small JPEGs are sent as uploaded unless they are heavier than this (about quality 95);
+# re-encoding them only loses detail and often makes them larger
+PASSTHROUGH_MAX_BYTES_PER_PIXEL = 1.0
+
+# Bounded pool for CPU-bound image work so it never runs on the event loop
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKER_THREADS, thread_name_prefix="image")
+
+@dataclass
+class EncodedImage:
+    """JPEG payload prepared for the model, with its dimensions."""
+    jpeg_bytes: bytes
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    quality: Optional[QualityReport] = None
+    # Size of the largest pixel buffer held while decoding
+    decoded_bytes: int = 0
+    # Seconds spent in each step: decode, resize, quality_check, encode, thumbnail
+    timings: dict = field(default_factory=dict)
+    # Small JPEG kept in the analysis history
+    thumbnail: Optional[bytes] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.jpeg_bytes)
+
+async def run_in_image_pool(func, *args):
+    """Run a CPU-bound function in the image thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_image_executor, func, *args)
+
+def encode_for_model(image_contents: bytes, max_edge: int = IMAGE_MAX_EDGE,
+                     quality: int = IMAGE_JPEG_QUALITY,
+                     check_quality: bool = QUALITY_GATE_MODE != "off",
+                     thumbnail_edge: int = ANALYSIS_HISTORY_THUMBNAIL_EDGE if ANALYSIS_HISTORY_ENABLED else 0
+                     ) -> EncodedImage:
+    """Decode an upload, run the quality pre-check and re-encode it as a size-capped RGB JPEG.
+
+    An RGB JPEG already within max_edge and without EXIF or XMP metadata
+    is passed through unchanged. With thumbnail_edge set, a thumbnail is
+    made from the same decoded pixels as well.
+    """
+    timings = {}
+    started = time.perf_counter()
+    try:
+        # Only reads the header; pixels are decoded on first access
+        pil_image = Image.open(io.BytesIO(image_contents))
+        original_width, original_height = pil_image.size
+        if original_width * original_height > IMAGE_MAX_PIXELS:
+            raise ImageTooLargeError(
+                f"Image is {original_width}x{original_height}; at most {IMAGE_MAX_PIXELS} pixels are accepted"
+            )
+
+        # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding, so a
+        # large photo is never held in memory at full resolution
+        scale = max_edge / max(original_width, original_height)
+        # APP1 holds EXIF and XMP: location and camera data must not be sent on, and an
+        # EXIF orientation would have to be applied
+        passthrough = (
+            pil_image.format == "JPEG" and pil_image.mode == "RGB" and scale >= 1
+            and not any(marker == "APP1" for marker, _ in pil_image.applist)
+            and len(image_contents) <= original_width * original_height * PASSTHROUGH_MAX_BYTES_PER_PIXEL
+        )
+        if scale < 1:
+            pil_image.draft("RGB", (math.ceil(original_width * scale), math.ceil(original_height * scale)))
+        decoded_bytes = pil_image.width * pil_image.height * len(pil_image.getbands())
+
+        # Apply the camera orientation before resizing
+        pil_image = ImageOps.exif_transpose(pil_image)
+
+        # Convert to RGB if necessary
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+    except Image.DecompressionBombError as e:
+        logger.info(f"Refused decompression bomb: {str(e)}")
+        raise ImageTooLargeError(f"Image is too large; at most {IMAGE_MAX_PIXELS} pixels are accepted")
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        # PIL's message names internal objects, so the client gets a fixed one
+        logger.info(f"Unreadable image upload: {str(e)}")
+        raise InvalidImageError("Uploaded file is not a valid image")
+
+    timings["decode"] = time.perf_counter() - started
+
+    # Shrink so the long edge is at most max_edge (never upscales)
+    started = time.perf_counter()
+    pil_image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    timings["resize"] = time.perf_counter() - started
+
+    report = None
+    if check_quality:
+        started = time.perf_counter()
+        report = check_image_quality(pil_image, (original_width, original_height))
+        timings["quality_check"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if passthrough:
+        jpeg_bytes = image_contents
+    else:
+        buffered = io.BytesIO()
+        pil_image.save(buffered, format="JPEG", quality=quality)
+        jpeg_bytes = buffered.getvalue()
+    timings["encode"] = time.perf_counter() - started
+
+    thumbnail = None
+    if thumbnail_edge > 0:
+        started = time.perf_counter()
+        thumbnail = jpeg_bytes
+        if max(pil_image.size) > thumbnail_edge:
+            thumbnail = make_thumbnail(pil_image, thumbnail_edge, quality)
+        timings["thumbnail"] = time.perf_counter() - started
+    return EncodedImage(
+        jpeg_bytes=jpeg_bytes,
+        width=pil_image.width,
+        height=pil_image.height,
+        original_width=original_width,
+        original_height=original_height,
+        quality=report,
+        decoded_bytes=decoded_bytes,
+        timings=timings,
+        thumbnail=thumbnail,
+    )
+
+def make_thumbnail(pil_image: Image.Image, edge: int, quality: int = IMAGE_JPEG_QUALITY) -> bytes:
+    """JPEG of an image shrunk so its long edge is at most edge pixels."""
+    buffered = io.BytesIO()
+    ImageOps.contain(pil_image, (edge, edge), Image.LANCZOS).save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+def to_base64(jpeg_bytes: bytes) -> str:
+    """Encode JPEG bytes as a base64 string."""
+    return base64.b64encode(jpeg_bytes).decode()
+
+async def warm_up_image_pool() -> None:
+    """Start the image workers and load the JPEG codec ahead of the first upload."""
+    buffered = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffered, format="JPEG")
+    await run_in_image_pool(encode_for_model, buffered.getvalue())
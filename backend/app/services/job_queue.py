@@ -0,0 +1,397 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import math
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional, Set, Tuple
+from urllib.parse import urlparse
+from fastapi import HTTPException
+from ..core.config import (
+    JOB_DB_PATH,
+    JOB_WORKERS,
+    JOB_QUEUE_MAX_DEPTH,
+    JOB_LEASE_SECONDS,
+    JOB_RETENTION_HOURS,
+    JOB_CALLBACK_TIMEOUT,
+    JOB_CALLBACK_ALLOWED_HOSTS,
+)
+from ..utils.sqlite import ProcessLocalConnection
+from .analysis_service import analyze_skin_image
+from .rate_limiter import refund_analysis_quota
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when the job queue is over its depth limit."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+class JobStore:
+    """SQLite persistence for analysis jobs, so queued work survives restarts.
+
+    Several worker processes share one database. A job is leased by the
+    process holding it, queued in memory or running, and the lease is
+    renewed while that process lives; jobs whose lease has run out are
+    adopted by another process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = ProcessLocalConnection(path, self._create_schema, row_factory=True)
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        # Creates the schema now, so a broken database fails startup rather than the first job
+        with self._lock:
+            self._db.get()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                username TEXT NOT NULL,
+                patient_info TEXT,
+                image BLOB,
+                callback_url TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                lease_expires_at REAL,
+                quota_key TEXT
+            )"""
+        )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "lease_expires_at" not in columns:
+            # Databases created before leases; their running jobs count as expired
+            conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+        if "quota_key" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN quota_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        """Run a statement and return the number of rows it changed."""
+        with self._lock:
+            return self._connection().execute(sql, params).rowcount
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        # Fetched under the lock: the connection is shared by the threads of this process
+        with self._lock:
+            return self._connection().execute(sql, params).fetchone()
+
+    def create(self, job_id: str, username: str, patient_info: Optional[dict],
+               image: bytes, callback_url: Optional[str], lease_seconds: float,
+               quota_key: Optional[str] = None) -> None:
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, username, patient_info, image, callback_url, created_at, updated_at, "
+            "lease_expires_at, quota_key) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, username, json.dumps(patient_info), image, callback_url, now, now, now + lease_seconds,
+             quota_key),
+        )
+
+    def get(self, job_id: str, username: str) -> Optional[dict]:
+        """Return a job submitted by username, or None for unknown jobs and jobs of other users."""
+        row = self._fetchone(
+            "SELECT id, status, result, error, created_at, updated_at FROM jobs WHERE id = ? AND username = ?",
+            (job_id, username),
+        )
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def claim(self, job_id: str, lease_seconds: float) -> Optional[dict]:
+        """Atomically move a queued job to running and return its inputs."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ?, lease_expires_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, now + lease_seconds, job_id),
+            )
+            if cursor.rowcount != 1:
+                return None
+            row = conn.execute(
+                "SELECT username, patient_info, image, callback_url, quota_key FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return {
+            "username": row["username"],
+            "patient_info": json.loads(row["patient_info"]),
+            "image": row["image"],
+            "callback_url": row["callback_url"],
+            "quota_key": row["quota_key"],
+        }
+
+    def finish(self, job_id: str, status: str, result=None, error: Optional[str] = None) -> None:
+        # The upload is no longer needed once the job has finished
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL, updated_at = ?, lease_expires_at = NULL "
+            "WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+
+    def renew(self, job_ids: List[str], lease_seconds: float) -> None:
+        """Extend the leases of jobs this process still holds."""
+        if job_ids:
+            self._execute(
+                f"UPDATE jobs SET lease_expires_at = ? WHERE id IN ({', '.join('?' * len(job_ids))}) "
+                "AND status IN ('queued', 'running')",
+                (time.time() + lease_seconds, *job_ids),
+            )
+
+    def expire(self, job_ids: List[str]) -> None:
+        """Give up the leases of jobs this process will not finish, so another one adopts them."""
+        if job_ids:
+            self._execute(
+                f"UPDATE jobs SET lease_expires_at = 0 WHERE id IN ({', '.join('?' * len(job_ids))}) "
+                "AND status IN ('queued', 'running')",
+                tuple(job_ids),
+            )
+
+    def adopt_expired(self, lease_seconds: float) -> List[str]:
+        """Lease unfinished jobs whose holder has gone away and return their ids, oldest first.
+
+        Jobs that were running when their process died are queued again.
+        """
+        now = time.time()
+        expired = "status IN ('queued', 'running') AND (lease_expires_at IS NULL OR lease_expires_at < ?)"
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(f"SELECT id FROM jobs WHERE {expired} ORDER BY created_at", (now,)).fetchall()
+                conn.execute(
+                    f"UPDATE jobs SET status = 'queued', lease_expires_at = ? WHERE {expired}", (now + lease_seconds, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [row["id"] for row in rows]
+
+    def purge_finished(self, older_than: float) -> int:
+        return self._execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?", (older_than,)
+        )
+
+class JobQueue:
+    """In-process worker pool draining analysis jobs persisted in a JobStore.
+
+    Every worker process runs its own queue. Jobs submitted here are run
+    here; jobs left behind by a process that stopped or died are adopted
+    once their lease runs out.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_MAX_DEPTH,
+                 lease_seconds: float = JOB_LEASE_SECONDS):
+        self.store = store
+        self.workers = workers
+        self.max_depth = max_depth
+        self.lease_seconds = lease_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Ids of jobs this process holds leases on, queued or running
+        self._held: Set[str] = set()
+        self._http_client = None
+        # Moving average of job duration, used to estimate Retry-After
+        self._avg_duration = 10.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        import httpx
+
+        await asyncio.to_thread(self.store.open)
+        purged = await asyncio.to_thread(self.store.purge_finished, time.time() - JOB_RETENTION_HOURS * 3600)
+        self._queue = asyncio.Queue()
+        recovered = await self._adopt_expired()
+        self._http_client = httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._keep_leases()))
+        logger.info(f"Job queue started: {self.workers} workers, {recovered} recovered, {purged} purged")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._held:
+            # Hand unfinished jobs to the remaining worker processes instead of waiting out the lease
+            await asyncio.to_thread(self.store.expire, list(self._held))
+            logger.info(f"Released {len(self._held)} unfinished jobs")
+            self._held.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        await asyncio.to_thread(self.store.close)
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog is expected to drain."""
+        return max(1, math.ceil(self.depth * self._avg_duration / self.workers))
+
+    async def submit(self, image: bytes, username: str, patient_info: Optional[dict] = None,
+                     callback_url: Optional[str] = None, quota_key: Optional[str] = None) -> str:
+        """Persist a job and queue it, or raise QueueFullError when shedding load.
+
+        quota_key is the rate-limit client key the job was charged to; a job
+        refused before reaching the model is refunded to it.
+        """
+        if self.depth >= self.max_depth:
+            raise QueueFullError(self.retry_after())
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, username, patient_info, image, callback_url,
+                                self.lease_seconds, quota_key)
+        self._held.add(job_id)
+        self._queue.put_nowait(job_id)
+        logger.info(f"Analysis job {job_id} queued for user {username} (depth {self.depth})")
+        return job_id
+
+    async def get(self, job_id: str, username: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.get, job_id, username)
+
+    async def _adopt_expired(self) -> int:
+        job_ids = await asyncio.to_thread(self.store.adopt_expired, self.lease_seconds)
+        for job_id in job_ids:
+            if job_id not in self._held:
+                self._held.add(job_id)
+                self._queue.put_nowait(job_id)
+        return len(job_ids)
+
+    async def _keep_leases(self) -> None:
+        """Renew the leases of held jobs and adopt jobs whose holder has gone away."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.store.renew, list(self._held), self.lease_seconds)
+                adopted = await self._adopt_expired()
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {str(e)}")
+                continue
+            if adopted:
+                logger.info(f"Adopted {adopted} jobs left by another worker")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Unexpected error running job {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+            # Not reached when cancelled: stop() still has to release the job
+            self._held.discard(job_id)
+
+    async def _run(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.claim, job_id, self.lease_seconds)
+        if job is None:
+            return
+        started = time.perf_counter()
+        try:
+            result = await analyze_skin_image(job["image"], job["username"], job["patient_info"])
+            status, error = "succeeded", None
+        except HTTPException as e:
+            result, status, error = None, "failed", str(e.detail)
+            if job["quota_key"]:
+                await refund_analysis_quota(job["quota_key"], e.status_code)
+        self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.perf_counter() - started)
+        await asyncio.to_thread(self.store.finish, job_id, status, result, error)
+        logger.info(f"Analysis job {job_id} {status}")
+        if job["callback_url"]:
+            await self._notify(job["callback_url"], {"job_id": job_id, "status": status, "result": result, "error": error})
+
+    async def _notify(self, callback_url: str, payload: dict) -> None:
+        try:
+            # Resolved again since the host's DNS may have changed since the job was submitted
+            address = await validate_callback_url(callback_url)
+        except HTTPException as e:
+            logger.warning(f"Callback for job {payload['job_id']} to {callback_url} refused: {e.detail}")
+            return
+        url, headers, extensions = pin_callback_url(callback_url, address)
+        try:
+            response = await self._http_client.post(url, json=payload, headers=headers, extensions=extensions)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Callback for job {payload['job_id']} to {callback_url} failed: {str(e)}")
+
+async def _resolve(hostname: str, port: Optional[int]) -> list:
+    infos = await asyncio.get_running_loop().getaddrinfo(hostname, port, type=socket.SOCK_STREAM)
+    # Drop any IPv6 zone id ("fe80::1%eth0") before parsing
+    return [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+
+async def validate_callback_url(callback_url: str) -> Optional[str]:
+    """Reject callback URLs that could be used to reach internal services.
+
+    The URL must be http(s). Hosts on JOB_CALLBACK_ALLOWED_HOSTS are
+    trusted as configured; without an allow-list the host must resolve
+    only to public addresses, so loopback, private, link-local (cloud
+    metadata) and reserved addresses are refused.
+
+    Returns the checked address to send the callback to (see
+    pin_callback_url), or None for allow-listed hosts.
+    """
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise HTTPException(status_code=400, detail="callback_url must be an http(s) URL")
+    if JOB_CALLBACK_ALLOWED_HOSTS:
+        if parsed.hostname not in JOB_CALLBACK_ALLOWED_HOSTS:
+            raise HTTPException(status_code=400, detail="callback_url host is not allowed")
+        return
+    try:
+        addresses = await _resolve(parsed.hostname, parsed.port)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=400, detail="callback_url host could not be resolved")
+    if not addresses or not all(address.is_global for address in addresses):
+        raise HTTPException(status_code=400, detail="callback_url must resolve to a public address")
+    return str(addresses[0])
+
+def pin_callback_url(callback_url: str, address: Optional[str]) -> Tuple[str, dict, dict]:
+    """URL, headers and request extensions that send a callback to an already checked address.
+
+    Letting the HTTP client resolve the name again would allow DNS
+    rebinding: the name could point at a public address for the check
+    and at an internal one for the request. The host name is kept in
+    the Host header and as the TLS server name, so virtual hosting and
+    certificate checks still use it.
+    """
+    if address is None:
+        return callback_url, {}, {}
+    parsed = urlparse(callback_url)
+    userinfo, _, host = parsed.netloc.rpartition("@")
+    netloc = f"[{address}]" if ":" in address else address
+    if parsed.port:
+        netloc += f":{parsed.port}"
+    if userinfo:
+        netloc = f"{userinfo}@{netloc}"
+    extensions = {"sni_hostname": parsed.hostname} if parsed.scheme == "https" else {}
+    return parsed._replace(netloc=netloc).geturl(), {"Host": host}, extensions
+
+job_queue = JobQueue(JobStore(JOB_DB_PATH))
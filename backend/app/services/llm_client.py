@@ -0,0 +1,311 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+from ..core.config import (
+    LLM_BACKEND,
+    LLM_MODEL,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_STUB_LATENCY_MS,
+    LLM_WARMUP_TIMEOUT,
+    LLM_TIMEOUT_SECONDS,
+    LLM_FALLBACK_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+class LLMError(Exception):
+    """A model call failed. Retryable errors may succeed when the call is repeated."""
+    retryable = False
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        # Seconds the upstream asked us to wait, from its Retry-After header
+        self.retry_after = retry_after
+
+class LLMTimeoutError(LLMError):
+    """The model did not answer within the deadline."""
+    retryable = True
+
+class LLMUnavailableError(LLMError):
+    """The model API could not be reached, was overloaded (429) or failed (5xx)."""
+    retryable = True
+
+def _as_llm_error(error: Exception) -> LLMError:
+    """Translate an OpenAI SDK exception into an LLMError."""
+    import openai
+
+    if isinstance(error, LLMError):
+        return error
+    if isinstance(error, openai.APITimeoutError):
+        return LLMTimeoutError("Model request timed out")
+    if isinstance(error, openai.APIConnectionError):
+        return LLMUnavailableError(f"Could not reach the model API: {str(error)}")
+    if isinstance(error, openai.APIStatusError):
+        retry_after = None
+        try:
+            retry_after = float(error.response.headers.get("retry-after", ""))
+        except ValueError:
+            pass
+        if error.status_code == 429 or error.status_code >= 500:
+            return LLMUnavailableError(f"Model API returned {error.status_code}", retry_after)
+        return LLMError(f"Model API rejected the request ({error.status_code}): {error.message}")
+    return LLMError(str(error))
+
+@dataclass
+class ChatResult:
+    """Text and token usage returned by a chat completion."""
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+class UsageCounter:
+    """Running totals of model calls, token usage and call time."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0
+
+    def record(self, prompt_tokens: int, completion_tokens: int, seconds: float) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.seconds += seconds
+
+    def stats(self) -> dict:
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / calls, 1),
+            "avg_completion_tokens": round(self.completion_tokens / calls, 1),
+            "avg_seconds": round(self.seconds / calls, 3),
+        }
+
+class LLMBackend:
+    """Interface for chat-completion backends used by the services.
+
+    ``response_format`` takes the OpenAI parameter of the same name, e.g. a
+    JSON schema the reply must follow. Backends record token usage of
+    every call in ``usage``.
+    """
+
+    def __init__(self):
+        self.usage = UsageCounter()
+
+    async def chat(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                   response_format: Optional[dict] = None) -> ChatResult:
+        """Send OpenAI-style chat messages and return the reply."""
+        raise NotImplementedError
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                     response_format: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield the reply as text deltas while it is generated."""
+        result = await self.chat(messages, max_tokens, temperature, response_format)
+        yield result.content
+
+    async def warm_up(self) -> None:
+        """Prime connections before the first request is served."""
+
+    async def aclose(self) -> None:
+        """Release connections held by the backend."""
+
+    def stats(self) -> dict:
+        """Retry, hedging and circuit breaker counters; empty for backends without them."""
+        return {}
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions over one long-lived, pooled HTTP client."""
+
+    def __init__(self, model: str = LLM_MODEL, api_key: Optional[str] = OPENAI_API_KEY,
+                 base_url: Optional[str] = OPENAI_BASE_URL, client=None):
+        import httpx
+        from openai import AsyncOpenAI
+
+        super().__init__()
+        self.model = model
+        self._owns_client = client is None
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                )
+            )
+            # Retries and deadlines are handled by ResilientBackend, not by the SDK
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                                 timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+        self._client = client
+
+    def with_model(self, model: str) -> "OpenAIBackend":
+        """Backend for another model sharing this one's connection pool and usage counters."""
+        backend = OpenAIBackend(model=model, client=self._client)
+        backend.usage = self.usage
+        return backend
+
+    def _request(self, messages: List[dict], max_tokens: int, temperature: float,
+                 response_format: Optional[dict]) -> dict:
+        request = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        if response_format:
+            request["response_format"] = response_format
+        return request
+
+    async def chat(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                   response_format: Optional[dict] = None) -> ChatResult:
+        started = time.perf_counter()
+        try:
+            response = await self._client.chat.completions.create(
+                **self._request(messages, max_tokens, temperature, response_format)
+            )
+        except Exception as e:
+            raise _as_llm_error(e) from e
+        usage = response.usage
+        result = ChatResult(
+            content=response.choices[0].message.content or "",
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+        )
+        self.usage.record(result.prompt_tokens, result.completion_tokens, time.perf_counter() - started)
+        return result
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                     response_format: Optional[dict] = None) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        try:
+            response = await self._client.chat.completions.create(
+                **self._request(messages, max_tokens, temperature, response_format),
+                stream=True,
+                # The final chunk then carries the token usage of the whole reply
+                stream_options={"include_usage": True},
+            )
+            async for chunk in response:
+                if chunk.usage:
+                    self.usage.record(
+                        chunk.usage.prompt_tokens, chunk.usage.completion_tokens, time.perf_counter() - started
+                    )
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise _as_llm_error(e) from e
+
+    async def warm_up(self) -> None:
+        # A cheap authenticated call opens and keeps a pooled TLS connection
+        try:
+            await asyncio.wait_for(self._client.models.list(), timeout=LLM_WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"LLM warm-up request failed: {str(e)}")
+
+    async def aclose(self) -> None:
+        if self._owns_client:
+            await self._client.close()
+
+class StubBackend(LLMBackend):
+    """In-process backend that returns a canned analysis, for tests and benchmarks."""
+
+    def __init__(self, latency_ms: int = LLM_STUB_LATENCY_MS, reply: Optional[str] = None):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.reply = reply or json.dumps({
+            "condition": "Contact dermatitis",
+            "severity": "Mild",
+            "description": "Localized redness with mild scaling consistent with an irritant reaction.",
+            "recommendations": [
+                "Avoid the suspected irritant",
+                "Apply a fragrance-free moisturizer twice daily",
+                "Consult a dermatologist if it persists beyond two weeks"
+            ]
+        })
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # Roughly four characters per token for English text
+        return len(text) // 4
+
+    def _prompt_tokens(self, messages: List[dict]) -> int:
+        text = ""
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                text += content
+            else:
+                text += "".join(part.get("text", "") for part in content)
+        return self._estimate_tokens(text)
+
+    async def chat(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                   response_format: Optional[dict] = None) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        result = ChatResult(
+            content=self.reply,
+            prompt_tokens=self._prompt_tokens(messages),
+            completion_tokens=self._estimate_tokens(self.reply),
+        )
+        self.usage.record(result.prompt_tokens, result.completion_tokens, self.latency_ms / 1000)
+        return result
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                     response_format: Optional[dict] = None) -> AsyncIterator[str]:
+        # Spread the simulated latency over roughly token-sized chunks
+        chunks = [self.reply[i:i + 16] for i in range(0, len(self.reply), 16)]
+        for chunk in chunks:
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000 / len(chunks))
+            yield chunk
+        self.usage.record(self._prompt_tokens(messages), self._estimate_tokens(self.reply), self.latency_ms / 1000)
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+def create_llm_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    """Build the backend selected by LLM_BACKEND, wrapped with deadlines, retries and a circuit breaker."""
+    from .llm_resilience import ResilientBackend
+
+    if name == "openai":
+        primary = OpenAIBackend()
+        fallback = primary.with_model(LLM_FALLBACK_MODEL) if LLM_FALLBACK_MODEL else None
+        return ResilientBackend(primary, fallback)
+    if name == "stub":
+        return ResilientBackend(StubBackend())
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
+
+def set_llm_backend(backend: Optional[LLMBackend]) -> None:
+    """Replace the process-wide backend, e.g. with a stub in tests."""
+    global _backend
+    _backend = backend
+
+def get_llm_backend() -> LLMBackend:
+    """Return the process-wide backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        # Warm-up creates the backend in a thread, so guard against a racing request
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_llm_backend()
+                logger.info(f"LLM backend initialized: {LLM_BACKEND}")
+    return _backend
+
+def llm_usage_stats() -> dict:
+    """Usage counters of the process-wide backend, empty until it has been created."""
+    return _backend.usage.stats() if _backend is not None else {}
+
+def llm_resilience_stats() -> dict:
+    """Resilience counters of the process-wide backend, empty until it has been created."""
+    return _backend.stats() if _backend is not None else {}
+
+async def close_llm_backend() -> None:
+    """Close the process-wide backend at shutdown."""
+    global _backend
+    if _backend is not None:
+        await _backend.aclose()
+        _backend = None
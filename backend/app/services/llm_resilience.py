@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from ..core.config import (
+    LLM_TIMEOUT_SECONDS,
+    LLM_TOTAL_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_BREAKER_WINDOW,
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_FAILURE_RATE,
+    LLM_BREAKER_SLOW_CALL_SECONDS,
+    LLM_BREAKER_OPEN_SECONDS,
+)
+from .llm_client import ChatResult, LLMBackend, LLMError, LLMTimeoutError, LLMUnavailableError
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(LLMUnavailableError):
+    """The circuit breaker is open and no fallback model is configured."""
+    retryable = False
+
+class LatencyTracker:
+    """Durations of recent successful calls, used to pick the hedging delay."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-quantile of recent latencies, or None until enough calls were seen."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over a sliding window of recent calls.
+
+    Closed, every call goes through. Once at least ``failure_rate`` of the
+    last ``window`` calls failed or were slower than ``slow_call_seconds``,
+    it opens and refuses calls for ``open_seconds``. It then lets a single
+    probe call through (half-open): success closes it, failure reopens it.
+    Only touched from the event loop.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = LLM_BREAKER_WINDOW, min_calls: int = LLM_BREAKER_MIN_CALLS,
+                 failure_rate: float = LLM_BREAKER_FAILURE_RATE,
+                 slow_call_seconds: float = LLM_BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds: float = LLM_BREAKER_OPEN_SECONDS):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state only the first caller gets through."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record(self, failed: bool, seconds: float) -> None:
+        bad = failed or seconds > self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if bad:
+                self._open()
+            else:
+                logger.info("LLM circuit breaker closed")
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append(bad)
+        if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+            self._open()
+
+    def release(self) -> None:
+        """Forget a call that ended without an outcome, e.g. a cancelled hedge."""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def _open(self) -> None:
+        logger.warning(f"LLM circuit breaker opened for {self.open_seconds:g}s")
+        self.state = self.OPEN
+        self.times_opened += 1
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+class ResilientBackend(LLMBackend):
+    """Wraps a backend with deadlines, retries, hedging and a circuit breaker.
+
+    Every attempt has its own deadline and all attempts of one call share
+    a total deadline. Timeouts, connection errors, 429 and 5xx are retried
+    with full-jitter exponential backoff, honouring Retry-After; other
+    errors are raised at once. With hedging enabled, a chat call that has
+    not answered after the recent latency quantile gets a second identical
+    request and the first answer wins. While the breaker is open, calls
+    go to the fallback backend, or fail fast with CircuitOpenError.
+
+    Streams are retried only until their first chunk has been yielded,
+    and are not hedged.
+    """
+
+    def __init__(self, primary: LLMBackend, fallback: Optional[LLMBackend] = None,
+                 timeout: float = LLM_TIMEOUT_SECONDS, total_timeout: float = LLM_TOTAL_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES, base_delay: float = LLM_RETRY_BASE_DELAY,
+                 max_delay: float = LLM_RETRY_MAX_DELAY, hedge_enabled: bool = LLM_HEDGE_ENABLED,
+                 hedge_quantile: float = LLM_HEDGE_QUANTILE, hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+                 breaker: Optional[CircuitBreaker] = None):
+        super().__init__()
+        self.primary = primary
+        self.fallback = fallback
+        # Token usage is counted by the wrapped backends
+        self.usage = primary.usage
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = LatencyTracker()
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.fallback_calls = 0
+        self.circuit_rejected = 0
+
+    def _route(self) -> Tuple[LLMBackend, bool]:
+        """Pick the backend for one attempt; the flag tells whether the breaker tracks it."""
+        if self.breaker.allow():
+            return self.primary, True
+        if self.fallback is not None:
+            self.fallback_calls += 1
+            return self.fallback, False
+        self.circuit_rejected += 1
+        retry_after = self.breaker.retry_after()
+        raise CircuitOpenError("The analysis model is temporarily unavailable", retry_after=retry_after)
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeoutError(f"Model did not answer within {self.total_timeout:.0f}s")
+        return min(self.timeout, remaining)
+
+    def _record(self, guarded: bool, started: float, error: Optional[BaseException]) -> None:
+        elapsed = time.monotonic() - started
+        if isinstance(error, LLMError):
+            self.failures += 1
+            if isinstance(error, LLMTimeoutError):
+                self.timeouts += 1
+        if not guarded:
+            return
+        if error is None:
+            self.latencies.record(elapsed)
+            self.breaker.record(False, elapsed)
+        elif isinstance(error, LLMError):
+            # Non-retryable errors such as 400 mean the API itself is healthy
+            self.breaker.record(error.retryable, elapsed)
+        else:
+            self.breaker.release()
+
+    async def _attempt(self, call: Callable[[LLMBackend], Awaitable[ChatResult]], deadline: float) -> ChatResult:
+        timeout = self._attempt_timeout(deadline)
+        backend, guarded = self._route()
+        started = time.monotonic()
+        try:
+            try:
+                result = await asyncio.wait_for(call(backend), timeout)
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"Model did not answer within {timeout:.1f}s") from None
+        except BaseException as e:
+            self._record(guarded, started, e)
+            raise
+        self._record(guarded, started, None)
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        quantile = self.latencies.quantile(self.hedge_quantile)
+        if quantile is None:
+            return None
+        return max(self.hedge_min_delay, quantile)
+
+    async def _hedged_attempt(self, call: Callable[[LLMBackend], Awaitable[ChatResult]], deadline: float) -> ChatResult:
+        delay = self._hedge_delay()
+        if delay is None or time.monotonic() + delay >= deadline:
+            return await self._attempt(call, deadline)
+
+        first = asyncio.ensure_future(self._attempt(call, deadline))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            self.hedged_requests += 1
+            logger.info(f"Model call slower than {delay:.1f}s; sending a hedged request")
+            tasks.append(asyncio.ensure_future(self._attempt(call, deadline)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    # Prefer the first request's error; the hedge may only have hit the breaker
+                    if error is None or task is first:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _backoff(self, retry: int, error: LLMError) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+        if error.retry_after:
+            delay = max(delay, error.retry_after)
+        return delay
+
+    async def chat(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                   response_format: Optional[dict] = None) -> ChatResult:
+        async def call(backend: LLMBackend) -> ChatResult:
+            return await backend.chat(messages, max_tokens, temperature, response_format)
+
+        deadline = time.monotonic() + self.total_timeout
+        retry = 0
+        while True:
+            try:
+                return await self._hedged_attempt(call, deadline)
+            except LLMError as e:
+                delay = self._backoff(retry, e)
+                if not e.retryable or retry >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                retry += 1
+                self.retries += 1
+                logger.warning(f"Model call failed ({str(e)}); retry {retry} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float = 0,
+                     response_format: Optional[dict] = None) -> AsyncIterator[str]:
+        deadline = time.monotonic() + self.total_timeout
+        retry = 0
+        while True:
+            backend, guarded = self._route()
+            started = time.monotonic()
+            chunks = backend.stream(messages, max_tokens, temperature, response_format)
+            yielded = False
+            try:
+                while True:
+                    # The per-attempt timeout bounds the wait for each chunk, including the first
+                    timeout = self._attempt_timeout(deadline)
+                    try:
+                        delta = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise LLMTimeoutError(f"Model stream stalled for {timeout:.1f}s") from None
+                    yielded = True
+                    yield delta
+            except LLMError as e:
+                self._record(guarded, started, e)
+                delay = self._backoff(retry, e)
+                if (yielded or not e.retryable or retry >= self.max_retries
+                        or time.monotonic() + delay >= deadline):
+                    raise
+                retry += 1
+                self.retries += 1
+                logger.warning(f"Model stream failed before its first chunk ({str(e)}); retry {retry} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException as e:
+                self._record(guarded, started, e)
+                raise
+            finally:
+                await chunks.aclose()
+            self._record(guarded, started, None)
+            return
+
+    async def warm_up(self) -> None:
+        await self.primary.warm_up()
+
+    async def aclose(self) -> None:
+        if self.fallback is not None:
+            await self.fallback.aclose()
+        await self.primary.aclose()
+
+    def stats(self) -> dict:
+        p50 = self.latencies.quantile(0.5)
+        p95 = self.latencies.quantile(0.95)
+        return {
+            "circuit_state": self.breaker.state,
+            "circuit_open": 0 if self.breaker.state == CircuitBreaker.CLOSED else 1,
+            "circuit_opened": self.breaker.times_opened,
+            "circuit_rejected": self.circuit_rejected,
+            "fallback_calls": self.fallback_calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+        }
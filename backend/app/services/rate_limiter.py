@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+from fastapi import HTTPException, Request
+from ..core.config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_DB_PATH,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_ANALYSIS_BURST,
+    RATE_LIMIT_ANALYSIS_PER_MINUTE,
+    RATE_LIMIT_LOGIN_BURST,
+    RATE_LIMIT_LOGIN_PER_MINUTE,
+    RATE_LIMIT_SIGNUP_BURST,
+    RATE_LIMIT_SIGNUP_PER_MINUTE,
+    RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_CHAT_PER_MINUTE,
+    ANALYSIS_DAILY_QUOTA,
+    ANALYSIS_DAILY_QUOTA_PER_IP,
+)
+from ..core.metrics import rate_limited_total
+from ..utils.sqlite import ProcessLocalConnection
+
+logger = logging.getLogger(__name__)
+
+# Bucket name -> (burst size, tokens added per second)
+BUCKETS: Dict[str, Tuple[int, float]] = {
+    "analysis": (RATE_LIMIT_ANALYSIS_BURST, RATE_LIMIT_ANALYSIS_PER_MINUTE / 60),
+    "login": (RATE_LIMIT_LOGIN_BURST, RATE_LIMIT_LOGIN_PER_MINUTE / 60),
+    "signup": (RATE_LIMIT_SIGNUP_BURST, RATE_LIMIT_SIGNUP_PER_MINUTE / 60),
+    "chat": (RATE_LIMIT_CHAT_BURST, RATE_LIMIT_CHAT_PER_MINUTE / 60),
+}
+
+# Failures not charged to the daily quota: the client got no result and the model produced
+# nothing billable. 413 and 422 are refused before the model; 503 is a full queue, an open
+# circuit, or a model that stayed unreachable or overloaded through its retries. 502 (the
+# model rejected the request) and 504 (it may have worked until the deadline) are charged.
+QUOTA_REFUNDED_STATUSES = frozenset({413, 422, 503})
+
+def _refill(tokens: float, updated_at: float, capacity: int, rate: float, now: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+def _utc_day(now: float) -> int:
+    return int(now // 86400)
+
+class MemoryRateLimitStore:
+    """Token buckets and daily counters held in this worker's memory.
+
+    Every worker process enforces its own limits, so with N workers a
+    client can get up to N times the configured rate. Only touched from
+    the event loop.
+    """
+
+    blocking = False
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._quotas: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+
+    def _remember(self, entries: OrderedDict, key: str, value) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+
+    def take(self, key: str, capacity: int, rate: float, cost: int, now: float) -> float:
+        """Take cost tokens; returns 0 on success or the seconds until they are available."""
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = _refill(tokens, updated_at, capacity, rate, now)
+        if tokens < cost:
+            self._remember(self._buckets, key, (tokens, now))
+            return (cost - tokens) / rate if rate > 0 else math.inf
+        self._remember(self._buckets, key, (tokens - cost, now))
+        return 0.0
+
+    def count(self, key: str, limit: int, cost: int, now: float) -> bool:
+        """Add cost to today's counter unless that would pass limit."""
+        day = _utc_day(now)
+        counted_day, used = self._quotas.get(key, (day, 0))
+        if counted_day != day:
+            used = 0
+        if used + cost > limit:
+            return False
+        self._remember(self._quotas, key, (day, used + cost))
+        return True
+
+    def refund(self, key: str, cost: int, now: float) -> None:
+        """Take cost back off today's counter."""
+        day = _utc_day(now)
+        counted_day, used = self._quotas.get(key, (day, 0))
+        if counted_day == day and used > 0:
+            self._quotas[key] = (day, max(0, used - cost))
+
+    def purge(self, now: float) -> int:
+        return 0
+
+class SQLiteRateLimitStore:
+    """Token buckets and daily counters in SQLite, shared by all worker processes.
+
+    Each check is one short write transaction, which keeps the limits
+    exact across workers at the cost of a database round trip per
+    limited request.
+    """
+
+    blocking = True
+
+    def __init__(self, path=RATE_LIMIT_DB_PATH):
+        self.path = path
+        self._db = ProcessLocalConnection(path, self._create_schema)
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS rate_limit_quotas (
+                key TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                used INTEGER NOT NULL,
+                PRIMARY KEY (key, day)
+            ) WITHOUT ROWID"""
+        )
+
+    def take(self, key: str, capacity: int, rate: float, cost: int, now: float) -> float:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = _refill(*(row or (capacity, now)), capacity, rate, now)
+                wait = 0.0
+                if tokens < cost:
+                    wait = (cost - tokens) / rate if rate > 0 else math.inf
+                else:
+                    tokens -= cost
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def count(self, key: str, limit: int, cost: int, now: float) -> bool:
+        day = _utc_day(now)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT used FROM rate_limit_quotas WHERE key = ? AND day = ?", (key, day)
+                ).fetchone()
+                used = row[0] if row else 0
+                allowed = used + cost <= limit
+                if allowed:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO rate_limit_quotas (key, day, used) VALUES (?, ?, ?)",
+                        (key, day, used + cost),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed
+
+    def refund(self, key: str, cost: int, now: float) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE rate_limit_quotas SET used = MAX(0, used - ?) WHERE key = ? AND day = ?",
+                (cost, key, _utc_day(now)),
+            )
+
+    def purge(self, now: float) -> int:
+        """Delete past days' counters and buckets idle for a day (long since refilled)."""
+        with self._lock:
+            conn = self._connection()
+            deleted = conn.execute("DELETE FROM rate_limit_quotas WHERE day < ?", (_utc_day(now),)).rowcount
+            deleted += conn.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - 86400,)).rowcount
+        return deleted
+
+class RateLimiter:
+    """Per-client token buckets and a daily analysis quota, answering 429 with Retry-After."""
+
+    def __init__(self, store, buckets: Dict[str, Tuple[int, float]] = BUCKETS,
+                 daily_quota: int = ANALYSIS_DAILY_QUOTA, enabled: bool = RATE_LIMIT_ENABLED,
+                 daily_quota_per_ip: bool = ANALYSIS_DAILY_QUOTA_PER_IP):
+        self.store = store
+        self.buckets = buckets
+        self.daily_quota = daily_quota
+        self.enabled = enabled
+        self.daily_quota_per_ip = daily_quota_per_ip
+
+    def _quota_applies(self, key: str) -> bool:
+        if not self.enabled or self.daily_quota <= 0:
+            return False
+        return self.daily_quota_per_ip or not key.startswith("ip:")
+
+    async def _call(self, func, *args):
+        if self.store.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    @staticmethod
+    def _reject(bucket: str, key: str, retry_after: float, detail: str):
+        rate_limited_total.inc(bucket=bucket)
+        logger.info(f"Rate limited {key} on {bucket}; retry in {retry_after:.0f}s")
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    async def hit(self, bucket: str, key: str, cost: int = 1) -> None:
+        """Take cost tokens from the client's bucket, raising 429 when it is empty."""
+        if not self.enabled:
+            return
+        capacity, rate = self.buckets[bucket]
+        # A batch larger than the burst size would never fit, so it drains the whole bucket
+        wait = await self._call(self.store.take, f"{bucket}:{key}", capacity, rate, min(cost, capacity), time.time())
+        if wait > 0:
+            self._reject(bucket, key, wait, "Too many requests, please slow down")
+
+    async def hit_daily_quota(self, key: str, cost: int = 1) -> None:
+        """Count cost analyses against the client's daily quota, raising 429 once it is used up."""
+        if not self._quota_applies(key):
+            return
+        now = time.time()
+        if not await self._call(self.store.count, f"analysis:{key}", self.daily_quota, cost, now):
+            self._reject(
+                "analysis_daily_quota", key, (_utc_day(now) + 1) * 86400 - now,
+                f"Daily analysis quota of {self.daily_quota} images used up",
+            )
+
+    async def refund_daily_quota(self, key: str, cost: int = 1) -> None:
+        """Give back quota charged for analyses that failed without a result (see QUOTA_REFUNDED_STATUSES)."""
+        if not self._quota_applies(key) or cost <= 0:
+            return
+        await self._call(self.store.refund, f"analysis:{key}", cost, time.time())
+
+    def purge(self) -> int:
+        return self.store.purge(time.time())
+
+rate_limiter = RateLimiter(SQLiteRateLimitStore() if RATE_LIMIT_BACKEND == "sqlite" else MemoryRateLimitStore())
+
+def client_key(request: Request, user=None) -> str:
+    """Rate-limit key of a request: the username when authenticated, else the client IP.
+
+    Behind a reverse proxy, run uvicorn with --proxy-headers and
+    --forwarded-allow-ips so request.client is the real client address.
+    """
+    if user is not None:
+        return f"user:{user.username}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def rate_limit(bucket: str):
+    """Dependency limiting an unauthenticated endpoint per client IP."""
+    async def dependency(request: Request) -> None:
+        await rate_limiter.hit(bucket, client_key(request))
+    return dependency
+
+async def enforce_rate_limit(bucket: str, request: Request, user=None) -> None:
+    """Apply a bucket keyed by the user, or by client IP for anonymous requests."""
+    await rate_limiter.hit(bucket, client_key(request, user))
+
+async def enforce_analysis_limits(request: Request, user=None, images: int = 1) -> str:
+    """Apply the analysis bucket and the daily quota to a request analyzing `images` images.
+
+    Returns the client key, for refund_analysis_quota.
+    """
+    key = client_key(request, user)
+    # The quota goes first so a client that has used it up does not also drain its bucket
+    await rate_limiter.hit_daily_quota(key, images)
+    try:
+        await rate_limiter.hit("analysis", key, images)
+    except HTTPException:
+        await rate_limiter.refund_daily_quota(key, images)
+        raise
+    return key
+
+async def refund_analysis_quota(key: str, *status_codes: int) -> None:
+    """Refund one image of daily quota per failure that left the client without a result.
+
+    Oversized uploads (413) and unreadable or rejected images (422) never
+    reach the model. A 503 is load shedding, an open circuit, or a model
+    that stayed unavailable through every retry; those attempts failed
+    without producing a reply. Timeouts (504) and rejected requests (502)
+    still count.
+    """
+    refunded = sum(1 for status_code in status_codes if status_code in QUOTA_REFUNDED_STATUSES)
+    if refunded:
+        await rate_limiter.refund_daily_quota(key, refunded)
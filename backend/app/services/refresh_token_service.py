@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
+from ..core.config import REFRESH_TOKEN_DB_PATH, REFRESH_TOKEN_EXPIRE_DAYS
+from ..utils.sqlite import ProcessLocalConnection
+
+logger = logging.getLogger(__name__)
+
+def _hash_token(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+class RefreshTokenStore:
+    """SQLite store of refresh tokens with rotation and reuse detection.
+
+    Only a SHA-256 digest of each token is stored. Tokens issued from the
+    same login share a family; presenting an already rotated token
+    revokes the whole family, since it means the token was copied.
+    """
+
+    def __init__(self, path=REFRESH_TOKEN_DB_PATH, lifetime_seconds: float = REFRESH_TOKEN_EXPIRE_DAYS * 86400):
+        self.path = path
+        self.lifetime_seconds = lifetime_seconds
+        self._db = ProcessLocalConnection(path, self._create_schema)
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS refresh_tokens (
+                token_hash BLOB PRIMARY KEY,
+                family_id TEXT NOT NULL,
+                username TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                revoked INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_refresh_family ON refresh_tokens (family_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_refresh_username ON refresh_tokens (username)")
+
+    def issue(self, username: str, family_id: Optional[str] = None) -> str:
+        """Create a refresh token for a user, starting a new family unless one is given."""
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO refresh_tokens (token_hash, family_id, username, expires_at) VALUES (?, ?, ?, ?)",
+                (_hash_token(token), family_id or uuid.uuid4().hex, username, time.time() + self.lifetime_seconds),
+            )
+        return token
+
+    def rotate(self, token: str) -> Optional[Tuple[str, str]]:
+        """Exchange a valid refresh token for a new one; returns (username, new_token) or None."""
+        new_token = secrets.token_urlsafe(32)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT family_id, username, expires_at, revoked FROM refresh_tokens WHERE token_hash = ?",
+                    (_hash_token(token),),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                family_id, username, expires_at, revoked = row
+                if revoked:
+                    conn.execute("UPDATE refresh_tokens SET revoked = 1 WHERE family_id = ?", (family_id,))
+                    conn.execute("COMMIT")
+                    logger.warning(f"Reuse of a rotated refresh token for user {username}; family revoked")
+                    return None
+                if expires_at <= time.time():
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute("UPDATE refresh_tokens SET revoked = 1 WHERE token_hash = ?", (_hash_token(token),))
+                conn.execute(
+                    "INSERT INTO refresh_tokens (token_hash, family_id, username, expires_at) VALUES (?, ?, ?, ?)",
+                    (_hash_token(new_token), family_id, username, time.time() + self.lifetime_seconds),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return username, new_token
+
+    def revoke(self, token: str) -> None:
+        """Revoke the family of a refresh token (logout of that session)."""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE refresh_tokens SET revoked = 1 WHERE family_id = "
+                "(SELECT family_id FROM refresh_tokens WHERE token_hash = ?)",
+                (_hash_token(token),),
+            )
+
+    def revoke_user(self, username: str) -> None:
+        """Revoke every refresh token of a user."""
+        with self._lock:
+            self._connection().execute("UPDATE refresh_tokens SET revoked = 1 WHERE username = ?", (username,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._connection().execute("DELETE FROM refresh_tokens WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+refresh_token_store = RefreshTokenStore()
+
+async def issue_refresh_token(username: str) -> str:
+    return await asyncio.to_thread(refresh_token_store.issue, username)
+
+async def rotate_refresh_token(token: str) -> Optional[Tuple[str, str]]:
+    return await asyncio.to_thread(refresh_token_store.rotate, token)
+
+async def revoke_refresh_token(token: str) -> None:
+    await asyncio.to_thread(refresh_token_store.revoke, token)
+
+async def revoke_user_refresh_tokens(username: str) -> None:
+    await asyncio.to_thread(refresh_token_store.revoke_user, username)
@@ -1,87 +1,68 @@
-import json
+import asyncio
 import logging
 from fastapi import HTTPException
 from ..models.user import User, UserInDB
-from ..core.config import USERS_FILE
-from ..core.security import verify_password, get_password_hash
+from ..core.security import get_password_hash, verify_and_update_password, run_in_password_pool
+from ..core.metrics import auth_failures_total
+from ..core.token_cache import token_cache
+from .user_store import user_store, DuplicateUserError
 
 logger = logging.getLogger(__name__)
 
-def load_users():
-    """Load users from JSON file."""
-    try:
-        if not USERS_FILE.exists():
-            # Create the file if it doesn't exist
-            with open(USERS_FILE, "w") as f:
-                json.dump({}, f)
-            return {}
-            
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading users: {str(e)}")
-        return {}
-
-def save_users(users):
-    """Save users to JSON file."""
-    try:
-        # Ensure the directory exists
-        USERS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Write the users data
-        with open(USERS_FILE, "w") as f:
-            json.dump(users, f)
-    except Exception as e:
-        logger.error(f"Error saving users: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail="Internal server error while saving user data"
-        )
+def _find_user(identifier: str):
+    # First try direct username lookup, then the email index
+    return user_store.get_by_username(identifier) or user_store.get_by_email(identifier)
 
-def get_user(identifier: str):
+async def get_user(identifier: str):
     """Get user by username or email."""
-    users = load_users()
-    
-    # First try direct username lookup
-    if identifier in users:
-        user_dict = users[identifier]
-        return UserInDB(**user_dict)
-    
-    # If not found, try to find by email
-    for username, user_data in users.items():
-        if user_data.get('email') == identifier:
-            return UserInDB(**user_data)
-    
-    return None
+    user_dict = await asyncio.to_thread(_find_user, identifier)
+    if user_dict is None:
+        return None
+    return UserInDB(**user_dict)
+
+async def update_user(username: str, **fields):
+    """Update a user record and drop its cached access tokens."""
+    user_dict = await asyncio.to_thread(user_store.update, username, **fields)
+    token_cache.invalidate_user(username)
+    return UserInDB(**user_dict) if user_dict else None
 
-def authenticate_user(identifier: str, password: str):
+async def authenticate_user(identifier: str, password: str):
     """Authenticate user with username/email and password."""
     try:
-        user = get_user(identifier)
+        user = await get_user(identifier)
         if not user:
             logger.info(f"User not found: {identifier}")
+            auth_failures_total.inc(cause="unknown_user")
             return False
-        if not verify_password(password, user.hashed_password):
+        verified, new_hash = await run_in_password_pool(verify_and_update_password, password, user.hashed_password)
+        if not verified:
             logger.info(f"Invalid password for user: {identifier}")
+            auth_failures_total.inc(cause="invalid_password")
+            return False
+        if user.disabled:
+            logger.info(f"Login refused for disabled user: {identifier}")
+            auth_failures_total.inc(cause="disabled_user")
             return False
+        if new_hash:
+            # Stored hash uses an outdated bcrypt cost; replace it transparently
+            await update_user(user.username, hashed_password=new_hash)
+            user.hashed_password = new_hash
+            logger.info(f"Password hash upgraded for user: {user.username}")
         logger.info(f"User authenticated successfully: {identifier}")
         return user
     except Exception as e:
         logger.error(f"Error during authentication for {identifier}: {str(e)}")
         return False
 
-def create_user(username: str, password: str, email: str, full_name: str):
+async def create_user(username: str, password: str, email: str, full_name: str):
     """Create a new user."""
-    users = load_users()
-    if username in users:
+    # Fail fast before paying for the password hash
+    if await asyncio.to_thread(user_store.get_by_username, username) is not None:
         raise HTTPException(status_code=400, detail="Username already registered")
+    if await asyncio.to_thread(user_store.get_by_email, email) is not None:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Check if email already exists
-    for existing_user in users.values():
-        if existing_user.get('email') == email:
-            raise HTTPException(status_code=400, detail="Email already registered")
-    
-    hashed_password = get_password_hash(password)
+    hashed_password = await run_in_password_pool(get_password_hash, password)
     user_dict = {
         "username": username,
         "email": email,
@@ -89,7 +70,16 @@ def create_user(username: str, password: str, email: str, full_name: str):
         "hashed_password": hashed_password,
         "disabled": False
     }
-    users[username] = user_dict
-    save_users(users)
+    try:
+        await asyncio.to_thread(user_store.add, user_dict)
+    except DuplicateUserError as e:
+        # Lost a race with a concurrent signup for the same username or email
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error saving users: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error while saving user data"
+        )
     logger.info(f"New user registered: {username}")
     return {"message": "User created successfully"}
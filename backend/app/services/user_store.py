@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+try:
+    import fcntl
+except ImportError:  # Windows: writes are serialized within one process only
+    fcntl = None
+from ..core.config import USERS_FILE, USER_STORE_BACKEND, USERS_DB_PATH, USERS_DB_POOL_SIZE
+from ..utils.sqlite import connect
+
+logger = logging.getLogger(__name__)
+
+class DuplicateUserError(Exception):
+    """Raised when a username or email is already registered."""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already registered")
+        self.field = field
+
+class UserStore:
+    """Interface for user storage backends.
+
+    Users are plain dicts with the UserInDB fields.
+    """
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def add(self, user: dict) -> None:
+        """Insert a new user, raising DuplicateUserError if the username or email is taken."""
+        raise NotImplementedError
+
+    def update(self, username: str, **fields) -> Optional[dict]:
+        """Change fields of an existing user and return the updated record."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the store."""
+
+class JSONUserStore(UserStore):
+    """users.json loaded into memory and indexed by username and email.
+
+    Lookups are dictionary hits on the in-memory indexes. The file is
+    reloaded when it changes on disk, so users added by other worker
+    processes are seen. Writes hold an exclusive lock on a sidecar lock
+    file, re-read the file and write it back with an atomic rename, so
+    concurrent signups in different workers are not lost and readers
+    never see a partially written file.
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._users: Optional[Dict[str, dict]] = None
+        self._by_email: Dict[str, str] = {}
+        self._version = None
+        self._lock = threading.RLock()
+
+    def _file_version(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        # A rename by another process changes the inode even within one mtime tick
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self) -> Dict[str, dict]:
+        version = self._file_version()
+        if self._users is None or version != self._version:
+            with self._lock:
+                if self._users is None or version != self._version:
+                    first_load = self._users is None
+                    self._set(self._read_file(), version)
+                    if first_load:
+                        logger.info(f"Loaded {len(self._users)} users from {self.path}")
+        return self._users
+
+    def _set(self, users: Dict[str, dict], version) -> None:
+        self._by_email = {user["email"]: username for username, user in users.items() if user.get("email")}
+        self._users = users
+        self._version = version
+
+    def _read_file(self) -> Dict[str, dict]:
+        try:
+            if not self.path.exists():
+                return {}
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading users: {str(e)}")
+            return {}
+
+    def _write_file(self, users: Dict[str, dict]) -> None:
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(users, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._set(users, self._file_version())
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize read-modify-write cycles between threads and worker processes."""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.path.with_name(f".{self.path.name}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        return self._load().get(username)
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        users = self._load()
+        username = self._by_email.get(email)
+        return users.get(username) if username is not None else None
+
+    def add(self, user: dict) -> None:
+        with self._write_lock():
+            users = self._load()
+            if user["username"] in users:
+                raise DuplicateUserError("Username")
+            if user["email"] in self._by_email:
+                raise DuplicateUserError("Email")
+            self._write_file({**users, user["username"]: user})
+
+    def update(self, username: str, **fields) -> Optional[dict]:
+        with self._write_lock():
+            users = self._load()
+            if username not in users:
+                return None
+            user = {**users[username], **fields}
+            if user.get("email") != users[username].get("email"):
+                if user["email"] in self._by_email:
+                    raise DuplicateUserError("Email")
+            self._write_file({**users, username: user})
+            return user
+
+    def count(self) -> int:
+        return len(self._load())
+
+USER_FIELDS = ("username", "email", "full_name", "hashed_password", "disabled")
+
+class SQLiteUserStore(UserStore):
+    """Users in SQLite (WAL mode) with unique username and email indexes.
+
+    Safe to share between worker processes: SQLite serializes writers and
+    the unique indexes reject duplicate signups atomically. Each process
+    keeps a small pool of connections, opened lazily after any fork.
+    """
+
+    def __init__(self, path=USERS_DB_PATH, pool_size: int = USERS_DB_POOL_SIZE, json_path=USERS_FILE):
+        self.path = path
+        self.pool_size = pool_size
+        self.json_path = json_path
+        self._pool: Optional[queue.LifoQueue] = None
+        self._pid = None
+        self._init_lock = threading.Lock()
+
+    def _ensure_pool(self) -> queue.LifoQueue:
+        if self._pool is None or self._pid != os.getpid():
+            with self._init_lock:
+                if self._pool is None or self._pid != os.getpid():
+                    conn = connect(self.path, row_factory=True)
+                    self._create_schema(conn)
+                    pool = queue.LifoQueue()
+                    pool.put(conn)
+                    for _ in range(self.pool_size - 1):
+                        pool.put(connect(self.path, row_factory=True))
+                    self._pool = pool
+                    self._pid = os.getpid()
+        return self._pool
+
+    @contextmanager
+    def _connection(self):
+        pool = self._ensure_pool()
+        conn = pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                email TEXT NOT NULL,
+                full_name TEXT NOT NULL,
+                hashed_password TEXT NOT NULL,
+                disabled INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email)")
+        conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+        migrate_json_users(conn, self.json_path)
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        user = dict(row)
+        user["disabled"] = bool(user["disabled"])
+        return user
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        return self._to_dict(row)
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return self._to_dict(row)
+
+    def add(self, user: dict) -> None:
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT INTO users (username, email, full_name, hashed_password, disabled) VALUES (?, ?, ?, ?, ?)",
+                    (user["username"], user["email"], user["full_name"], user["hashed_password"],
+                     int(bool(user.get("disabled")))),
+                )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateUserError("Email" if "email" in str(e) else "Username")
+
+    def update(self, username: str, **fields) -> Optional[dict]:
+        fields = {key: value for key, value in fields.items() if key in USER_FIELDS and key != "username"}
+        if "disabled" in fields:
+            fields["disabled"] = int(bool(fields["disabled"]))
+        try:
+            with self._connection() as conn:
+                if fields:
+                    assignments = ", ".join(f"{key} = ?" for key in fields)
+                    conn.execute(f"UPDATE users SET {assignments} WHERE username = ?", (*fields.values(), username))
+                row = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        except sqlite3.IntegrityError:
+            raise DuplicateUserError("Email")
+        return self._to_dict(row)
+
+    def count(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self) -> None:
+        if self._pool is not None and self._pid == os.getpid():
+            while not self._pool.empty():
+                self._pool.get_nowait().close()
+        self._pool = None
+
+def migrate_json_users(conn: sqlite3.Connection, json_path) -> int:
+    """Copy users from users.json into SQLite once; later calls are no-ops."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_migrated'").fetchone():
+            conn.execute("COMMIT")
+            return 0
+        users = {}
+        if json_path and json_path.exists():
+            with open(json_path, "r") as f:
+                users = json.load(f)
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, email, full_name, hashed_password, disabled) VALUES (?, ?, ?, ?, ?)",
+            [
+                (user["username"], user["email"], user.get("full_name", ""), user["hashed_password"],
+                 int(bool(user.get("disabled"))))
+                for user in users.values()
+            ],
+        )
+        conn.execute("INSERT INTO store_meta (key, value) VALUES ('json_migrated', ?)", (str(json_path),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if users:
+        logger.info(f"Migrated {len(users)} users from {json_path} to SQLite")
+    return len(users)
+
+def create_user_store(backend: str = USER_STORE_BACKEND) -> UserStore:
+    """Build the store selected by USER_STORE_BACKEND."""
+    if backend == "sqlite":
+        return SQLiteUserStore()
+    if backend == "json":
+        return JSONUserStore()
+    raise ValueError(f"Unknown USER_STORE_BACKEND: {backend}")
+
+user_store = create_user_store()
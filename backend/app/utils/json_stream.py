@@ -0,0 +1,80 @@
+import json
+from typing import List, Tuple
+
+class IncrementalJSONObjectParser:
+    """Parse a JSON object fed in arbitrary text chunks, field by field.
+
+    feed() returns the top-level ``(name, value)`` pairs completed by the
+    new chunk. Text before the opening brace (such as a markdown code
+    fence) is ignored, and each field is reported once, as soon as its
+    value is syntactically complete.
+    """
+
+    def __init__(self):
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self._member_emitted = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        fields = []
+        if self.done:
+            return fields
+        self._text += chunk
+        text = self._text
+        while self._pos < len(text):
+            char = text[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        # A closing quote at depth 1 ends either a key or a string value
+                        self._try_member(self._pos, fields)
+                continue
+            if char == '"':
+                self._in_string = self._depth > 0
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    if char != "{":
+                        self._depth = 0
+                        continue
+                    self._start_member(self._pos)
+            elif char in "}]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 1:
+                    self._try_member(self._pos, fields)
+                elif self._depth == 0:
+                    self._try_member(self._pos - 1, fields)
+                    self.done = True
+                    break
+            elif char == "," and self._depth == 1:
+                self._try_member(self._pos - 1, fields)
+                self._start_member(self._pos)
+        return fields
+
+    def _start_member(self, pos: int) -> None:
+        self._member_start = pos
+        self._member_emitted = False
+
+    def _try_member(self, end: int, fields: list) -> None:
+        if self._member_emitted or self._member_start is None:
+            return
+        member = self._text[self._member_start:end].strip()
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except ValueError:
+            return
+        fields.extend(parsed.items())
+        self._member_emitted = True
@@ -0,0 +1,11 @@
+import sys
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process in bytes, or 0 where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
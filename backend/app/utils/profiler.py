@@ -0,0 +1,200 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames of worker threads that are parked waiting for work
+_IDLE_FRAMES = {
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace("\\", "/").split("/")
+    # Package and file name are enough to tell PIL, base64, the SDK and app code apart
+    location = "/".join(path[-2:])
+    return f"{code.co_name} ({location}:{code.co_firstlineno})".replace(";", ":")
+
+class SamplingProfiler:
+    """Statistical profiler sampling the stacks of all threads from a background thread.
+
+    Sampling adds no tracing overhead to the profiled code. Stacks are
+    aggregated in collapsed form (``thread;outer;...;inner``), which
+    flamegraph.pl and speedscope read directly. Idle pool threads are
+    skipped; the event loop thread is always recorded, so time spent
+    waiting on the network shows up under ``select``.
+    """
+
+    def __init__(self, interval: float, loop_thread_id: int, max_depth: int = 64):
+        self.interval = interval
+        self.loop_thread_id = loop_thread_id
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id != self.loop_thread_id:
+                    code = frame.f_code
+                    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                        continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                thread_name = "event-loop" if thread_id == self.loop_thread_id else names.get(thread_id, str(thread_id))
+                self.stacks[";".join([thread_name, *reversed(stack)])] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, title: str, top: int = 25) -> str:
+        """Top functions by own (innermost) and total samples, as percentages of sampling ticks."""
+        own = Counter()
+        total = Counter()
+        threads = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            threads[frames[0]] += count
+            own[frames[-1]] += count
+            for label in set(frames[1:]):
+                total[label] += count
+        ticks = self.samples or 1
+        lines = [
+            title,
+            f"{self.duration:.3f}s, {self.samples} samples every {self.interval * 1000:g} ms",
+            # Several busy threads are sampled per tick, so totals can exceed 100%
+            "Busy samples by thread: " + ", ".join(f"{name} {count}" for name, count in threads.most_common()),
+            "",
+            "Top functions by own samples:",
+        ]
+        lines += [f"  {count / ticks:6.1%}  {count:6d}  {label}" for label, count in own.most_common(top)]
+        lines += ["", "Top functions by total samples:"]
+        lines += [f"  {count / ticks:6.1%}  {count:6d}  {label}" for label, count in total.most_common(top)]
+        return "\n".join(lines) + "\n"
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles single requests on demand.
+
+    A request is profiled when it carries ``X-Profile: <token>`` or is
+    picked at ``sample_rate``. Only one request is profiled at a time and
+    at most one per ``min_interval`` seconds; others run untouched. The
+    response gets an ``X-Profile-Id`` header naming the artifacts written
+    to ``profile_dir``: ``<id>.collapsed`` (flamegraph input) and
+    ``<id>.txt`` (top functions).
+
+    Samples cover every thread of the worker, so work of concurrent
+    requests shows up too; the summary records how many were in flight.
+    """
+
+    def __init__(self, app, profile_dir, token: str = "", sample_rate: float = 0.0,
+                 interval_ms: float = 5, min_interval: float = 30, max_files: int = 50):
+        self.app = app
+        self.profile_dir = profile_dir
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.min_interval = min_interval
+        self.max_files = max_files
+        self._active = False
+        self._last_started = -min_interval
+        self._in_flight = 0
+
+    def _requested(self, scope) -> Optional[str]:
+        """Return how the request asked to be profiled, or None."""
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    if hmac.compare_digest(value.decode("latin-1"), self.token):
+                        return "header"
+                    break
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self._in_flight += 1
+        try:
+            trigger = self._requested(scope)
+            now = time.monotonic()
+            if trigger is None or self._active or now - self._last_started < self.min_interval:
+                if trigger == "header":
+                    logger.info(f"Profile of {scope['path']} skipped by the rate limit")
+                await self.app(scope, receive, send)
+                return
+            self._active = True
+            self._last_started = now
+            try:
+                await self._profile(scope, receive, send, trigger)
+            finally:
+                self._active = False
+        finally:
+            self._in_flight -= 1
+
+    async def _profile(self, scope, receive, send, trigger: str) -> None:
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        concurrent = self._in_flight - 1
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        profiler = SamplingProfiler(self.interval, threading.get_ident())
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            title = (
+                f"{scope['method']} {scope['path']} ({trigger}); "
+                f"{concurrent} other requests in flight when it started"
+            )
+            try:
+                await asyncio.to_thread(self._write, profile_id, profiler, title)
+                logger.info(f"Profiled {scope['method']} {scope['path']} in {profiler.duration:.3f}s: {profile_id}")
+            except OSError as e:
+                logger.warning(f"Could not write profile {profile_id}: {str(e)}")
+
+    def _write(self, profile_id: str, profiler: SamplingProfiler, title: str) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        (self.profile_dir / f"{profile_id}.collapsed").write_text(profiler.collapsed())
+        (self.profile_dir / f"{profile_id}.txt").write_text(profiler.summary(title))
+        # Keep only the newest profiles
+        profiles = sorted(self.profile_dir.glob("*.txt"))
+        for old in profiles[:-self.max_files] if self.max_files > 0 else []:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".collapsed").unlink(missing_ok=True)
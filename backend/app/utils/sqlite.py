@@ -0,0 +1,48 @@
+import os
+import sqlite3
+from typing import Callable, Optional
+
+def connect(path, row_factory: bool = False) -> sqlite3.Connection:
+    """Open a connection the way every store here uses SQLite.
+
+    Autocommit mode (transactions are explicit BEGIN IMMEDIATE), WAL so
+    readers never block the writer, and a busy timeout for when several
+    worker processes write to the same file.
+    """
+    conn = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+    if row_factory:
+        conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class ProcessLocalConnection:
+    """One SQLite connection per process, opened lazily on first use.
+
+    A connection must not be used across a fork, so a worker that finds
+    the one its parent opened opens its own. ``setup`` runs on each new
+    connection, typically to create the schema. Callers serialize their
+    use of the connection themselves.
+    """
+
+    def __init__(self, path, setup: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 row_factory: bool = False):
+        self.path = path
+        self.setup = setup
+        self.row_factory = row_factory
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+
+    def get(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = connect(self.path, self.row_factory)
+            if self.setup is not None:
+                self.setup(conn)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
@@ -0,0 +1,120 @@
+import time
+from typing import Dict, Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from ..core.config import MAX_UPLOAD_BYTES
+from ..core.metrics import analysis_stage_seconds, analysis_errors_total, request_body_rejected_total, upload_bytes
+
+# Room for the multipart boundaries and the text form fields next to the files
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+class RequestBodyTooLarge(HTTPException):
+    """Raised when a request body or uploaded file is over its size limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Upload too large: the limit is {limit} bytes")
+
+class RequestBodyLimitMiddleware:
+    """ASGI middleware that refuses request bodies above a byte limit with 413.
+
+    A declared Content-Length over the limit is rejected before any of the
+    body is read. Otherwise bytes are counted as they arrive, so chunked
+    uploads are cut off as soon as they cross the limit instead of being
+    spooled in full first.
+
+    Multipart uploads are also timed from the first read of the body to its
+    last chunk, as the ``upload_receive`` stage, so slow clients show up in
+    the stage histograms.
+
+    overhead_bytes is allowed on top of each limit for the multipart
+    framing and form fields, but the 413 reports the configured limit.
+    """
+
+    def __init__(self, app, max_body_bytes: int, path_limits: Optional[Dict[str, int]] = None,
+                 overhead_bytes: int = 0):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.path_limits = path_limits or {}
+        self.overhead_bytes = overhead_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"].rstrip("/"), self.max_body_bytes)
+        allowed = limit + self.overhead_bytes
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > allowed:
+            request_body_rejected_total.inc()
+            await self._reject(limit, scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+        timed = headers.get(b"content-type", b"").startswith(b"multipart/form-data")
+        receive_started = None
+
+        async def limited_receive():
+            nonlocal received, timed, receive_started
+            if receive_started is None:
+                receive_started = time.perf_counter()
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > allowed:
+                    request_body_rejected_total.inc()
+                    # Raised inside body parsing, so FastAPI turns it into the 413 response
+                    raise RequestBodyTooLarge(limit)
+                if timed and not message.get("more_body", False):
+                    # Includes the time the form parser spends spooling chunks between reads
+                    analysis_stage_seconds.observe(time.perf_counter() - receive_started, stage="upload_receive")
+                    timed = False
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestBodyTooLarge:
+            if response_started:
+                raise
+            await self._reject(limit, scope, receive, send)
+
+    @staticmethod
+    async def _reject(limit: int, scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": RequestBodyTooLarge(limit).detail})
+        await response(scope, receive, send)
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an uploaded file in chunks, raising 413 once it exceeds max_bytes.
+
+    By now the body has been received and spooled by the form parser, so the
+    ``upload_spool_read`` stage only covers copying the spooled file into
+    memory; network receive time is the ``upload_receive`` stage.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        analysis_errors_total.inc(cause="upload_too_large")
+        raise RequestBodyTooLarge(max_bytes)
+    started = time.perf_counter()
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            analysis_errors_total.inc(cause="upload_too_large")
+            raise RequestBodyTooLarge(max_bytes)
+        chunks.append(chunk)
+    analysis_stage_seconds.observe(time.perf_counter() - started, stage="upload_spool_read")
+    upload_bytes.observe(total)
+    return b"".join(chunks)
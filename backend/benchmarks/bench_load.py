@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Offline load test of the main endpoints.
+
+Starts benchmarks/fake_openai.py as the model API and the app pointed at
+it, then drives /signup, /token, /users/me and /api/analyze at each
+concurrency level. Analysis requests cycle through a corpus of synthetic
+skin-like images of several sizes. Prints one JSON document with
+throughput, latency percentiles and the server's peak RSS per scenario,
+meant to be saved and compared between releases.
+
+    python benchmarks/bench_load.py --concurrency 1 8 32 --requests 100 --output results.json
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import platform
+import time
+import uuid
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from common import benchmark_env, latency_summary, peak_rss_mb, run_fake_openai, run_server, temporary_data_dir
+
+ENDPOINTS = ("signup", "token", "users_me", "analyze")
+PASSWORD = "bench-password"
+
+# /metrics samples reported at the end: parse, token usage and retry/hedging/circuit breaker counters
+SERVER_STATS_PREFIXES = ("analysis_", "llm_")
+
+# Long edge of each corpus image; phone photos are 3000-4000 px
+IMAGE_SIZES = {"small": (640, 480), "medium": (1600, 1200), "large": (4032, 3024)}
+
+def synthetic_image(width: int, height: int, seed: int) -> bytes:
+    """JPEG of skin-toned texture with a darker patch, sharp enough to pass the quality gate."""
+    rng = np.random.default_rng(seed)
+    small = (height // 8, width // 8)
+    base = np.array([214, 160, 130], dtype=np.float32)
+    pixels = base + rng.normal(0, 18, size=small + (3,))
+    yy, xx = np.mgrid[0:small[0], 0:small[1]]
+    center_y, center_x = rng.uniform(0.3, 0.7) * small[0], rng.uniform(0.3, 0.7) * small[1]
+    lesion = ((yy - center_y) ** 2 + (xx - center_x) ** 2) < (min(small) * 0.15) ** 2
+    pixels[lesion] -= [40, 60, 50]
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).resize((width, height), Image.NEAREST)
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+def build_corpus(per_size: int) -> list:
+    corpus = []
+    for size_index, (name, (width, height)) in enumerate(IMAGE_SIZES.items()):
+        for index in range(per_size):
+            corpus.append((name, synthetic_image(width, height, seed=size_index * 1000 + index)))
+    return corpus
+
+async def signup(client: httpx.AsyncClient, state: dict) -> httpx.Response:
+    username = f"load-{uuid.uuid4().hex[:12]}"
+    return await client.post("/signup", data={
+        "username": username, "password": PASSWORD, "email": f"{username}@example.com", "full_name": "Load Test",
+    })
+
+async def token(client: httpx.AsyncClient, state: dict) -> httpx.Response:
+    return await client.post("/token", data={"username": state["username"], "password": PASSWORD})
+
+async def users_me(client: httpx.AsyncClient, state: dict) -> httpx.Response:
+    return await client.get("/users/me", headers={"Authorization": f"Bearer {state['access_token']}"})
+
+async def analyze(client: httpx.AsyncClient, state: dict) -> httpx.Response:
+    name, image = next(state["images"])
+    symptoms = "Itchy red patch"
+    if state["unique_inputs"]:
+        # Distinct patient info keeps repeated images from being cached or coalesced
+        symptoms += f" ({next(state['request_ids'])})"
+    return await client.post(
+        "/api/analyze",
+        files={"image": (f"{name}.jpg", image, "image/jpeg")},
+        data={"name": "Load Test", "duration": "2 weeks", "symptoms": symptoms},
+    )
+
+REQUESTS = {"signup": signup, "token": token, "users_me": users_me, "analyze": analyze}
+
+async def run_scenario(base_url: str, endpoint: str, concurrency: int, requests: int, state: dict) -> dict:
+    latencies, statuses = [], {}
+    remaining = itertools.count()
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        async def worker():
+            while next(remaining) < requests:
+                started = time.perf_counter()
+                try:
+                    response = await REQUESTS[endpoint](client, state)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "statuses": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": requests / elapsed,
+        "latency": latency_summary(latencies),
+    }
+
+async def prepare(base_url: str, corpus: list, unique_inputs: bool) -> dict:
+    """Register the user the login and /users/me scenarios reuse."""
+    username = f"load-{uuid.uuid4().hex[:12]}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        response = await client.post("/signup", data={
+            "username": username, "password": PASSWORD, "email": f"{username}@example.com", "full_name": "Load Test",
+        })
+        response.raise_for_status()
+        response = await client.post("/token", data={"username": username, "password": PASSWORD})
+        response.raise_for_status()
+    return {
+        "username": username,
+        "access_token": response.json()["access_token"],
+        "images": itertools.cycle(corpus),
+        "unique_inputs": unique_inputs,
+        "request_ids": itertools.count(),
+    }
+
+def server_stats(metrics_text: str) -> dict:
+    """Unlabeled analysis_* and llm_* samples of a /metrics page."""
+    stats = {}
+    for line in metrics_text.splitlines():
+        name, _, value = line.partition(" ")
+        if name.startswith(SERVER_STATS_PREFIXES) and "{" not in name:
+            stats[name] = float(value)
+    return stats
+
+async def run(base_url: str, pid: int, args, corpus: list) -> tuple:
+    state = await prepare(base_url, corpus, unique_inputs=not args.cache)
+    results = []
+    for endpoint in args.endpoints:
+        for concurrency in args.concurrency:
+            result = await run_scenario(base_url, endpoint, concurrency, args.requests, state)
+            result["server_peak_rss_mb"] = peak_rss_mb(pid)
+            results.append(result)
+    # Counters accumulated over the run
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        stats = server_stats((await client.get("/metrics")).text)
+    return results, stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and concurrency level")
+    parser.add_argument("--images-per-size", type=int, default=4)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=0)
+    parser.add_argument("--llm-error-rate", type=float, default=0)
+    parser.add_argument("--llm-error-status", type=int, default=500, help="HTTP status of injected errors")
+    parser.add_argument("--llm-slow-rate", type=float, default=0, help="fraction of model calls made slow")
+    parser.add_argument("--llm-slow-ms", type=float, default=10000)
+    parser.add_argument("--reply-file", help="model reply to serve instead of the canned analysis")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--cache", action="store_true",
+                        help="keep the analysis result cache enabled and repeat identical inputs")
+    parser.add_argument("--server-env", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="extra app settings, e.g. LLM_HEDGE_ENABLED=true LLM_MAX_RETRIES=0")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.images_per_size)
+    config = {
+        **{key: value for key, value in vars(args).items() if key != "output"},
+        "image_sizes": {name: list(size) for name, size in IMAGE_SIZES.items()},
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+
+    server_env = dict(item.split("=", 1) for item in args.server_env)
+    with run_fake_openai(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                         error_rate=args.llm_error_rate, reply_file=args.reply_file,
+                         error_status=args.llm_error_status, slow_rate=args.llm_slow_rate,
+                         slow_ms=args.llm_slow_ms) as openai_url:
+        with temporary_data_dir() as data_dir:
+            env = benchmark_env(
+                data_dir,
+                LLM_BACKEND="openai",
+                OPENAI_API_KEY="fake-key",
+                OPENAI_BASE_URL=openai_url,
+                BCRYPT_ROUNDS=args.bcrypt_rounds,
+                ANALYSIS_CACHE_ENABLED=str(args.cache).lower(),
+                **server_env,
+            )
+            with run_server(env) as (base_url, process):
+                results, server_stats = asyncio.run(run(base_url, process.pid, args, corpus))
+                peak = peak_rss_mb(process.pid)
+
+    report = {"config": config, "results": results, "server_peak_rss_mb": peak, "server_stats": server_stats}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
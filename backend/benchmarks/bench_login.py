@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark.
+
+Starts the API in a child process, registers a user, then fires a burst of
+concurrent POST /token requests while probing an unrelated endpoint
+(/health/live) in a tight loop. Reports logins/sec and the probe latency
+during the burst, which shows whether bcrypt work stalls the event loop.
+
+    python benchmarks/bench_login.py --logins 40 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from common import benchmark_env, latency_summary, run_server, temporary_data_dir
+
+USERNAME = "bench-user"
+PASSWORD = "bench-password"
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/health/live")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.005)
+
+async def login(client: httpx.AsyncClient, slots: asyncio.Semaphore, latencies: list, failures: list) -> None:
+    async with slots:
+        started = time.perf_counter()
+        response = await client.post("/token", data={"username": USERNAME, "password": PASSWORD})
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            failures.append(response.status_code)
+
+async def run(base_url: str, logins: int, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        response = await client.post("/signup", data={
+            "username": USERNAME, "password": PASSWORD, "email": "bench@example.com", "full_name": "Bench User",
+        })
+        response.raise_for_status()
+
+        # Idle baseline for the probe endpoint
+        idle = []
+        for _ in range(50):
+            started = time.perf_counter()
+            await client.get("/health/live")
+            idle.append(time.perf_counter() - started)
+
+        stop = asyncio.Event()
+        probe_latencies, login_latencies, failures = [], [], []
+        probe_task = asyncio.create_task(probe(client, stop, probe_latencies))
+        slots = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(login(client, slots, login_latencies, failures) for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe_task
+
+    return {
+        "logins": logins,
+        "concurrency": concurrency,
+        "failures": len(failures),
+        "elapsed_s": elapsed,
+        "logins_per_s": logins / elapsed,
+        "login_latency": latency_summary(login_latencies),
+        "probe_latency_idle": latency_summary(idle),
+        "probe_latency_during_burst": latency_summary(probe_latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    with temporary_data_dir() as data_dir:
+        env = benchmark_env(data_dir, BCRYPT_ROUNDS=args.bcrypt_rounds)
+        with run_server(env) as (base_url, _):
+            result = asyncio.run(run(base_url, args.logins, args.concurrency))
+    result["bcrypt_rounds"] = args.bcrypt_rounds
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
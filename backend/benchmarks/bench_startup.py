@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start cost of the API: module import time and the time from
+lifespan start until the readiness probe reports ready.
+
+Each measurement runs in a fresh interpreter so nothing is cached between
+runs. Results are printed as JSON.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a child interpreter; prints a JSON line with its timings
+CHILD_SCRIPT = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+from app.main import app
+import_s = time.perf_counter() - t0
+
+async def startup():
+    t1 = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        while not app.state.ready:
+            await asyncio.sleep(0.005)
+        return time.perf_counter() - t1
+
+ready_s = asyncio.run(startup())
+print(json.dumps({"import_s": import_s, "ready_s": ready_s}))
+"""
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def import_profile(env: dict, top: int) -> list:
+    """Slowest modules by cumulative import time (python -X importtime)."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": us / 1000} for us, name in rows[:top]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to report")
+    parser.add_argument("--backend", default="stub", help="LLM_BACKEND used for the measurement")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "benchmark-secret")
+    env["LLM_BACKEND"] = args.backend
+
+    runs = [run_once(env) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "backend": args.backend,
+        "import_s_median": statistics.median(r["import_s"] for r in runs),
+        "ready_s_median": statistics.median(r["ready_s"] for r in runs),
+        "import_s": [r["import_s"] for r in runs],
+        "ready_s": [r["ready_s"] for r in runs],
+        "slowest_imports": import_profile(env, args.top),
+    }
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
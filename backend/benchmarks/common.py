@@ -0,0 +1,124 @@
+"""Helpers shared by the benchmark scripts."""
+
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def latency_summary(seconds) -> dict:
+    """p50/p95/p99/max of a list of latencies, in milliseconds."""
+    return {
+        "count": len(seconds),
+        "p50_ms": percentile(seconds, 50) * 1000,
+        "p95_ms": percentile(seconds, 95) * 1000,
+        "p99_ms": percentile(seconds, 99) * 1000,
+        "max_ms": max(seconds) * 1000 if seconds else 0.0,
+    }
+
+def benchmark_env(data_dir: str, **overrides) -> dict:
+    """Environment for an isolated app instance storing its data in data_dir."""
+    env = dict(os.environ)
+    env.update({
+        "SECRET_KEY": env.get("SECRET_KEY", "benchmark-secret"),
+        "LLM_BACKEND": "stub",
+        "USERS_DB_PATH": os.path.join(data_dir, "users.db"),
+        "JOB_DB_PATH": os.path.join(data_dir, "jobs.db"),
+        "REFRESH_TOKEN_DB_PATH": os.path.join(data_dir, "refresh_tokens.db"),
+        "RATE_LIMIT_DB_PATH": os.path.join(data_dir, "rate_limits.db"),
+        "ANALYSIS_HISTORY_DB_PATH": os.path.join(data_dir, "analyses.db"),
+        # Benchmarks send every request from one address
+        "RATE_LIMIT_ENABLED": "false",
+    })
+    env.update({key: str(value) for key, value in overrides.items()})
+    return env
+
+@contextlib.contextmanager
+def run_server(env: dict, app: str = "app.main:app", port: int = None, ready_path: str = "/health/ready",
+               timeout: float = 30, app_dir: str = "."):
+    """Start uvicorn in a child process and yield its base URL and Popen handle once ready."""
+    port = port or free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--app-dir", app_dir,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{app} exited with code {process.returncode}")
+            try:
+                if httpx.get(base_url + ready_path, timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{app} did not become ready within {timeout}s")
+            time.sleep(0.05)
+        yield base_url, process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+@contextlib.contextmanager
+def run_fake_openai(latency_ms: float = 800, jitter_ms: float = 0, token_ms: float = 10,
+                    error_rate: float = 0, reply_file: str = None, error_status: int = 500,
+                    slow_rate: float = 0, slow_ms: float = 10000):
+    """Start benchmarks/fake_openai.py and yield its OpenAI base URL (ending in /v1)."""
+    env = dict(os.environ)
+    env.update({
+        "FAKE_OPENAI_LATENCY_MS": str(latency_ms),
+        "FAKE_OPENAI_JITTER_MS": str(jitter_ms),
+        "FAKE_OPENAI_TOKEN_MS": str(token_ms),
+        "FAKE_OPENAI_ERROR_RATE": str(error_rate),
+        "FAKE_OPENAI_ERROR_STATUS": str(error_status),
+        "FAKE_OPENAI_SLOW_RATE": str(slow_rate),
+        "FAKE_OPENAI_SLOW_MS": str(slow_ms),
+    })
+    if reply_file:
+        env["FAKE_OPENAI_REPLY_FILE"] = reply_file
+    with run_server(env, app="fake_openai:app", app_dir="benchmarks", ready_path="/v1/models") as (base_url, _):
+        yield base_url + "/v1"
+
+def peak_rss_mb(pid: int):
+    """Peak resident set size of a process in MiB (Linux only; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+@contextlib.contextmanager
+def temporary_data_dir():
+    with tempfile.TemporaryDirectory(prefix="bench-") as path:
+        yield path
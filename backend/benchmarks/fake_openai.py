@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI chat-completions server for offline benchmarks.
+
+Answers POST /v1/chat/completions (plain and streamed) with a canned skin
+analysis after a configurable delay, and GET /v1/models for the startup
+warm-up. Token usage is estimated so the app's token metrics stay
+meaningful. Point the app at it with OPENAI_BASE_URL=http://host:port/v1.
+
+Configured through environment variables:
+
+    FAKE_OPENAI_LATENCY_MS       delay before the first token (default 800)
+    FAKE_OPENAI_JITTER_MS        uniform random extra delay (default 0)
+    FAKE_OPENAI_TOKEN_MS         delay between streamed chunks (default 10)
+    FAKE_OPENAI_REPLY_FILE       file whose contents replace the canned reply
+    FAKE_OPENAI_ERROR_RATE       fraction of requests answered with an error (default 0)
+    FAKE_OPENAI_ERROR_STATUS     HTTP status of those errors, e.g. 429 or 503 (default 500)
+    FAKE_OPENAI_SLOW_RATE        fraction of requests delayed by FAKE_OPENAI_SLOW_MS (default 0)
+    FAKE_OPENAI_SLOW_MS          extra delay of slow requests, for tail latency (default 10000)
+
+    python benchmarks/fake_openai.py --port 9100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "800"))
+JITTER_MS = float(os.getenv("FAKE_OPENAI_JITTER_MS", "0"))
+TOKEN_MS = float(os.getenv("FAKE_OPENAI_TOKEN_MS", "10"))
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+ERROR_STATUS = int(os.getenv("FAKE_OPENAI_ERROR_STATUS", "500"))
+SLOW_RATE = float(os.getenv("FAKE_OPENAI_SLOW_RATE", "0"))
+SLOW_MS = float(os.getenv("FAKE_OPENAI_SLOW_MS", "10000"))
+
+DEFAULT_REPLY = json.dumps({
+    "condition": "Contact dermatitis",
+    "severity": "Mild",
+    "description": "Localized redness with mild scaling consistent with an irritant reaction.",
+    "recommendations": [
+        "Avoid the suspected irritant",
+        "Apply a fragrance-free moisturizer twice daily",
+        "Consult a dermatologist if it persists beyond two weeks"
+    ]
+})
+
+if os.getenv("FAKE_OPENAI_REPLY_FILE"):
+    with open(os.environ["FAKE_OPENAI_REPLY_FILE"]) as f:
+        REPLY = f.read()
+else:
+    REPLY = DEFAULT_REPLY
+
+# A 1024px image costs GPT-4o roughly this many prompt tokens at high detail
+IMAGE_TOKENS = 765
+
+app = FastAPI(title="Fake OpenAI")
+
+def estimate_prompt_tokens(messages: list) -> int:
+    tokens = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                tokens += IMAGE_TOKENS
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return tokens
+
+def usage(messages: list) -> dict:
+    prompt_tokens = estimate_prompt_tokens(messages)
+    completion_tokens = len(REPLY) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+async def first_token_delay() -> None:
+    delay_ms = LATENCY_MS + random.uniform(0, JITTER_MS)
+    if SLOW_RATE and random.random() < SLOW_RATE:
+        delay_ms += SLOW_MS
+    await asyncio.sleep(delay_ms / 1000)
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "gpt-4o", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return JSONResponse(
+            status_code=ERROR_STATUS,
+            content={"error": {"message": "Injected failure", "type": "server_error"}},
+            headers={"Retry-After": "1"} if ERROR_STATUS == 429 else None,
+        )
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "gpt-4o")
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await first_token_delay()
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": REPLY},
+                "finish_reason": "stop",
+            }],
+            "usage": usage(body.get("messages", [])),
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def events():
+        def chunk(choices, **extra):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                       "model": model, "choices": choices, **extra}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        await first_token_delay()
+        # Roughly one token per chunk
+        for start in range(0, len(REPLY), 4):
+            yield chunk([{"index": 0, "delta": {"content": REPLY[start:start + 4]}, "finish_reason": None}])
+            if TOKEN_MS:
+                await asyncio.sleep(TOKEN_MS / 1000)
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if include_usage:
+            yield chunk([], usage=usage(body.get("messages", [])))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
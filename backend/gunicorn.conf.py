@@ -0,0 +1,58 @@
+"""
+Gunicorn settings for running the API in production.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Starts one uvicorn worker per CPU core (on uvloop and httptools, which
+uvicorn[standard] installs) from an app imported once in the master.
+Workers are recycled after a number of requests and given time to finish
+in-flight requests on SIGTERM. Settings live in app/core/config.py, so
+they can be set in .env like the rest.
+"""
+
+import os
+
+from app.core.config import (
+    WEB_CONCURRENCY,
+    PORT,
+    WORKER_MAX_REQUESTS,
+    WORKER_MAX_REQUESTS_JITTER,
+    WORKER_GRACEFUL_TIMEOUT,
+    WORKER_TIMEOUT,
+    FORWARDED_ALLOW_IPS,
+    RATE_LIMIT_BACKEND,
+)
+
+def available_cores() -> int:
+    """CPU cores this process may run on, which respects container CPU sets."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{PORT}"
+workers = WEB_CONCURRENCY or available_cores()
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app before forking: workers share its memory pages and a broken build fails
+# once, in the master. Connections, clients and thread pools are created lazily or in the
+# lifespan, so none of them cross the fork.
+preload_app = True
+
+max_requests = WORKER_MAX_REQUESTS
+max_requests_jitter = WORKER_MAX_REQUESTS_JITTER
+graceful_timeout = WORKER_GRACEFUL_TIMEOUT
+timeout = WORKER_TIMEOUT
+# Longer than the idle timeout of typical load balancers, so they close connections first
+keepalive = 75
+
+# Addresses allowed to set X-Forwarded-For/-Proto; without the proxy here, every client
+# appears to come from the proxy and shares its rate limits
+forwarded_allow_ips = FORWARDED_ALLOW_IPS
+
+def when_ready(server):
+    server.log.info(f"Starting {workers} workers, recycled every ~{max_requests} requests")
+    if workers > 1 and RATE_LIMIT_BACKEND == "memory":
+        server.log.warning(
+            "RATE_LIMIT_BACKEND=memory enforces limits per worker; set it to sqlite to share them"
+        )
@@ -1,20 +1,21 @@
 #!/usr/bin/env python3
 """
-Entry point for the Precision Health AI application.
-Run this file to start the server.
+Development entry point for the Precision Health AI application.
+Run this file to start a single auto-reloading server; production runs
+gunicorn with gunicorn.conf.py instead (see the Procfile).
 """
 
 import uvicorn
-from app.main import app
+from app.core.config import PORT
 from app.utils.logging import setup_logging
 
 if __name__ == "__main__":
     logger = setup_logging()
-    logger.info("Starting Precision Health AI server...")
+    logger.info("Starting Precision Health AI development server...")
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
-        port=8001,
+        port=PORT,
         reload=True,  # Enable auto-reload for development
         log_level="info"
-    ) 
\ No newline at end of file
+    )
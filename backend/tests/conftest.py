@@ -0,0 +1,5 @@
+import os
+
+# app.core.config refuses to load without these; tests never call the real model
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("LLM_BACKEND", "stub")
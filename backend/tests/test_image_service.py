@@ -0,0 +1,55 @@
+import io
+import pytest
+from PIL import Image
+from app.services.image_service import InvalidImageError, encode_for_model
+
+def _jpeg(width: int, height: int) -> bytes:
+    buffered = io.BytesIO()
+    Image.new("RGB", (width, height), (214, 160, 130)).save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+def _size(jpeg_bytes: bytes):
+    with Image.open(io.BytesIO(jpeg_bytes)) as image:
+        return image.size
+
+def test_thumbnail_does_not_replace_model_image():
+    encoded = encode_for_model(_jpeg(1600, 1200), max_edge=1024, check_quality=False, thumbnail_edge=256)
+    assert (encoded.width, encoded.height) == (1024, 768)
+    assert _size(encoded.jpeg_bytes) == (1024, 768)
+    assert _size(encoded.thumbnail) == (256, 192)
+
+def test_small_image_is_its_own_thumbnail():
+    encoded = encode_for_model(_jpeg(200, 150), max_edge=1024, check_quality=False, thumbnail_edge=256)
+    assert _size(encoded.jpeg_bytes) == (200, 150)
+    assert encoded.thumbnail == encoded.jpeg_bytes
+
+def test_no_thumbnail_when_disabled():
+    encoded = encode_for_model(_jpeg(640, 480), max_edge=1024, check_quality=False, thumbnail_edge=0)
+    assert encoded.thumbnail is None
+
+def test_small_clean_jpeg_is_sent_unchanged():
+    upload = _jpeg(800, 600)
+    encoded = encode_for_model(upload, max_edge=1024, check_quality=False, thumbnail_edge=0)
+    assert encoded.jpeg_bytes == upload
+
+def test_jpeg_with_exif_is_reencoded():
+    exif = Image.Exif()
+    exif[0x0110] = "Phone"  # camera model
+    buffered = io.BytesIO()
+    Image.new("RGB", (800, 600), (214, 160, 130)).save(buffered, format="JPEG", exif=exif)
+    encoded = encode_for_model(buffered.getvalue(), max_edge=1024, check_quality=False, thumbnail_edge=0)
+    assert encoded.jpeg_bytes != buffered.getvalue()
+    with Image.open(io.BytesIO(encoded.jpeg_bytes)) as image:
+        assert "exif" not in image.info
+
+def test_png_is_reencoded_as_jpeg():
+    buffered = io.BytesIO()
+    Image.new("RGB", (400, 300), (214, 160, 130)).save(buffered, format="PNG")
+    encoded = encode_for_model(buffered.getvalue(), max_edge=1024, check_quality=False, thumbnail_edge=0)
+    with Image.open(io.BytesIO(encoded.jpeg_bytes)) as image:
+        assert image.format == "JPEG"
+
+def test_invalid_image_message_does_not_leak_internals():
+    with pytest.raises(InvalidImageError) as exc:
+        encode_for_model(b"not an image", check_quality=False, thumbnail_edge=0)
+    assert str(exc.value) == "Uploaded file is not a valid image"
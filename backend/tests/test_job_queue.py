@@ -0,0 +1,47 @@
+import asyncio
+import ipaddress
+import pytest
+from fastapi import HTTPException
+from app.services import job_queue
+from app.services.job_queue import JobStore, pin_callback_url, validate_callback_url
+
+def _resolving_to(monkeypatch, *addresses):
+    async def resolve(hostname, port):
+        return [ipaddress.ip_address(address) for address in addresses]
+    monkeypatch.setattr(job_queue, "_resolve", resolve)
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.0.0.5", "169.254.169.254", "::1", "::ffff:127.0.0.1"])
+def test_callback_to_internal_address_is_refused(monkeypatch, address):
+    _resolving_to(monkeypatch, "93.184.216.34", address)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(validate_callback_url("https://callback.example/hook"))
+    assert exc.value.status_code == 400
+
+def test_callback_is_pinned_to_the_checked_address(monkeypatch):
+    _resolving_to(monkeypatch, "93.184.216.34")
+    address = asyncio.run(validate_callback_url("https://callback.example:8443/hook?x=1"))
+    url, headers, extensions = pin_callback_url("https://callback.example:8443/hook?x=1", address)
+    assert url == "https://93.184.216.34:8443/hook?x=1"
+    assert headers == {"Host": "callback.example:8443"}
+    assert extensions == {"sni_hostname": "callback.example"}
+
+def test_pinned_ipv6_address_is_bracketed():
+    url, headers, extensions = pin_callback_url("http://user:pw@callback.example/hook", "2606:2800:220:1::1")
+    assert url == "http://user:pw@[2606:2800:220:1::1]/hook"
+    assert headers == {"Host": "callback.example"}
+    assert extensions == {}
+
+def test_allow_listed_host_is_not_pinned():
+    assert pin_callback_url("https://internal/hook", None) == ("https://internal/hook", {}, {})
+
+def test_job_store_round_trip(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.open()
+    store.create("job1", "alice", None, b"image", None, 60, "user:alice")
+    assert store.get("job1", "bob") is None
+    assert store.get("job1", "alice")["status"] == "queued"
+    assert store.claim("job1", 60)["quota_key"] == "user:alice"
+    store.finish("job1", "succeeded", {"condition": "ok"})
+    assert store.get("job1", "alice")["result"] == {"condition": "ok"}
+    assert store.purge_finished(float("inf")) == 1
+    store.close()
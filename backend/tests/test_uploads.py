@@ -0,0 +1,24 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.utils.uploads import RequestBodyLimitMiddleware
+
+app = FastAPI()
+app.add_middleware(RequestBodyLimitMiddleware, max_body_bytes=1000, overhead_bytes=100)
+
+@app.post("/upload")
+async def upload(request: Request):
+    return {"received": len(await request.body())}
+
+client = TestClient(app)
+
+def test_body_within_limit_and_overhead_is_accepted():
+    assert client.post("/upload", content=b"x" * 1100).json() == {"received": 1100}
+
+def test_413_reports_the_configured_limit():
+    response = client.post("/upload", content=b"x" * 1101)
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Upload too large: the limit is 1000 bytes"}
+
+def test_chunked_body_is_cut_off():
+    response = client.post("/upload", content=(b"x" * 500 for _ in range(3)))
+    assert response.status_code == 413
@@ -15,8 +15,20 @@ interface ChatInterfaceProps {
   aiReport?: string;
 }
 
+// The analysis page passes the /api/analyze result list as JSON
+const parseReport = (aiReport?: string) => {
+  try {
+    const report = aiReport ? JSON.parse(aiReport) : undefined;
+    return Array.isArray(report) ? report[0] : report;
+  } catch {
+    return undefined;
+  }
+};
+
 const ChatInterface: React.FC<ChatInterfaceProps> = ({ aiReport }) => {
   const [messages, setMessages] = useState<Message[]>([]);
+  const analysis = parseReport(aiReport);
+  const [sessionId, setSessionId] = useState<string | undefined>(analysis?.chat_session_id);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [attachedFiles, setAttachedFiles] = useState<File[]>([]);
@@ -58,30 +70,63 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ aiReport }) => {
     setIsLoading(true);
 
     try {
-      // Call OpenAI API
-      const response = await fetch('https://precision-skin-insights-api.onrender.com/api/chat', {
+      // Chat works signed out too; only send a token when there is one
+      const token = localStorage.getItem('token');
+      const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+      if (token) headers['Authorization'] = `Bearer ${token}`;
+
+      // Stream the reply so it appears token by token instead of after the whole answer
+      const response = await fetch('https://precision-skin-insights-api.onrender.com/api/chat/stream', {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        },
+        headers,
         body: JSON.stringify({
           message: inputMessage,
-          history: messages.map(m => ({ role: m.role, content: m.content }))
+          session_id: sessionId,
+          // Only used by the server when the session has expired; it accepts the last 20 turns
+          history: messages.slice(-20).map(m => ({ role: m.role, content: m.content })),
+          analysis
         })
       });
 
-      if (!response.ok) throw new Error('Failed to get response');
-
-      const data = await response.json();
-      
-      const assistantMessage: Message = {
-        role: 'assistant',
-        content: data.response,
-        timestamp: new Date()
-      };
-
-      setMessages(prev => [...prev, assistantMessage]);
+      if (!response.ok || !response.body) throw new Error('Failed to get response');
+
+      // Placeholder that the token events fill in
+      setMessages(prev => [...prev, { role: 'assistant', content: '', timestamp: new Date() }]);
+      const setReply = (update: (content: string) => string) =>
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, content: update(last.content) }];
+        });
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finished = false;
+      while (!finished) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Server-Sent Events are separated by a blank line; keep any partial event for the next chunk
+        const events = buffer.split('\n\n');
+        buffer = events.pop() ?? '';
+        for (const block of events) {
+          const event = block.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? 'null');
+          if (event === 'session') {
+            setSessionId(data.session_id);
+          } else if (event === 'token') {
+            setReply(content => content + data.text);
+          } else if (event === 'done') {
+            setSessionId(data.session_id);
+            setReply(() => data.response);
+            finished = true;
+          } else if (event === 'error') {
+            setMessages(prev => prev.slice(0, -1));
+            throw new Error(data.detail);
+          }
+        }
+      }
+      if (!finished) throw new Error('Reply was interrupted');
     } catch (error) {
       toast({
         title: 'Error',